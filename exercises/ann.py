@@ -0,0 +1,139 @@
+"""
+Nearest-neighbour search backends over an (L2-normalized) embedding matrix.
+
+* `ExactIndex` scores the query against every row with one matrix product.
+* `IVFIndex` clusters the rows with (spherical) k-means and only scores the rows in the
+  `n_probe` clusters closest to the query. Raising `n_probe` trades speed for recall.
+
+All backends share the same interface: `search(queries, k)` takes a `(n_queries, dim)`
+array and returns `(rows, scores)`, each of shape `(n_queries, k)`, best match first.
+Use `make_index` to pick a backend; with `backend="auto"` small corpora use exact search.
+Backends that are expensive to build expose `state()`, which can be saved and passed
+back as `state=` to skip rebuilding.
+"""
+
+import numpy as np
+
+BLOCK = 8192
+
+
+def top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Indices and values of the k largest scores per row, sorted descending."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(scores.dtype)
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    vals = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-vals, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+
+class ExactIndex:
+    """Brute-force search: one BLAS matrix product per block of rows."""
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(queries).astype(np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        # Scan in blocks so that the score matrix stays small for large corpora.
+        for start in range(0, len(self.matrix), BLOCK):
+            block = np.asarray(self.matrix[start : start + BLOCK])
+            rows, scores = top_k(queries @ block.T, k)
+            rows = np.concatenate([best_rows, rows + start], axis=1)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            idx, best_scores = top_k(scores, k)
+            best_rows = np.take_along_axis(rows, idx, axis=1)
+        return best_rows, best_scores
+
+
+class IVFIndex:
+    """Inverted-file index: k-means clusters of rows, searched cluster by cluster."""
+
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        n_lists: int | None = None,
+        n_probe: int = 8,
+        n_iter: int = 10,
+        seed: int = 0,
+        state: dict | None = None,
+    ):
+        self.matrix = matrix
+        self.n_probe = n_probe
+        if state is not None:
+            self.centroids = state["centroids"]
+            self.order = state["order"]
+            self.offsets = state["offsets"]
+            return
+
+        n = len(matrix)
+        n_lists = max(1, min(n_lists or int(np.sqrt(n)), n))
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(matrix[np.sort(rng.choice(n, min(n, 256 * n_lists), replace=False))])
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(n_iter):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assign == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+        self.centroids = centroids
+
+        assign = np.concatenate(
+            [
+                np.argmax(np.asarray(matrix[i : i + BLOCK]) @ centroids.T, axis=1)
+                for i in range(0, n, BLOCK)
+            ]
+        )
+        # CSR layout: rows of list c are order[offsets[c]:offsets[c + 1]]
+        self.order = np.argsort(assign, kind="stable")
+        self.offsets = np.searchsorted(assign[self.order], np.arange(n_lists + 1))
+
+    def state(self) -> dict:
+        return {"centroids": self.centroids, "order": self.order, "offsets": self.offsets}
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(queries).astype(np.float32)
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes, _ = top_k(queries @ self.centroids.T, n_probe)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate(
+                [self.order[self.offsets[c] : self.offsets[c + 1]] for c in lists]
+            )
+            candidates.sort()  # sequential reads from the memory-mapped matrix
+            idx, vals = top_k((np.asarray(self.matrix[candidates]) @ query)[None, :], k)
+            rows[i, : idx.shape[1]] = candidates[idx[0]]
+            scores[i, : idx.shape[1]] = vals[0]
+        return rows, scores
+
+
+BACKENDS = {"exact": ExactIndex, "ivf": IVFIndex}
+
+
+def resolve_backend(n_rows: int, backend: str = "auto", exact_threshold: int = 20_000) -> str:
+    """`backend="auto"` uses exact search below `exact_threshold` rows and IVF above."""
+    if backend == "auto":
+        backend = "exact" if n_rows < exact_threshold else "ivf"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Choose one of {list(BACKENDS)}.")
+    return backend
+
+
+def make_index(matrix: np.ndarray, backend: str = "auto", exact_threshold: int = 20_000, **params):
+    """
+    Build a search index over `matrix`.
+
+    Additional `params` (e.g. `n_lists`, `n_probe`, or a saved `state`) are passed to
+    the backend; exact search has no parameters.
+    """
+    backend = resolve_backend(len(matrix), backend, exact_threshold)
+    if backend == "exact":
+        return ExactIndex(matrix)
+    return BACKENDS[backend](matrix, **params)
@@ -0,0 +1,154 @@
+"""
+Offline benchmark for the retrieval path of the RAG exercise (`src/02_rag.py`).
+
+Builds the index from `data/knowledge_base` with deterministic `HashingEmbeddings` (no
+network needed), runs the labelled queries in `data/rag_queries.json` and reports ingest
+time, index memory, p50/p95 query latency, the per-query cost of batched (multi-query)
+dense search and recall@k. A query's recall is the fraction of its expected snippets
+that occur in the top-k chunks.
+
+Usage (from the `exercises/` folder):
+
+    python bench_rag.py --mode hybrid --backend exact --chunk-size 1000 --chunk-overlap 200
+    python bench_rag.py --mode dense --storage int8 --rescore 32
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from bm25 import reciprocal_rank_fusion
+from fake_llm import HashingEmbeddings
+from ingest import PdfIngestor
+from vector_store import PersistentVectorStore
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def search(store: PersistentVectorStore, query: str, k: int, mode: str):
+    """Same retrieval strategies as `retrieve()` in `src/02_rag.py`."""
+    if mode == "dense":
+        return store.similarity_search(query, k=k)
+    if mode == "lexical":
+        return store.lexical_search(query, k=k)
+    dense = store.similarity_search(query, k=2 * k)
+    lexical = store.lexical_search(query, k=2 * k)
+    return reciprocal_rank_fusion([dense, lexical])[:k]
+
+
+def index_memory(store: PersistentVectorStore) -> int:
+    """
+    Bytes of the arrays searched at query time (embedding matrix or its compact copy,
+    ANN and BM25 index). Re-scoring only reads candidate rows of the float32 matrix.
+    """
+    total = store.search_matrix.nbytes + sum(a.nbytes for a in store.lexical.state().values())
+    if hasattr(store.index, "state"):
+        total += sum(a.nbytes for a in store.index.state().values())
+    return total
+
+
+def disk_usage(path: str) -> int:
+    return sum(os.path.getsize(f) for f in glob.glob(os.path.join(path, "*")))
+
+
+def run(args, index_dir: str) -> dict:
+    files = sorted(glob.glob(os.path.join(args.pdf_folder, "*.pdf")))
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap
+    )
+    ingestor = PdfIngestor(splitter, workers=args.workers, batch_size=args.batch_size)
+    store = PersistentVectorStore(
+        index_dir,
+        HashingEmbeddings(args.dimensions),
+        backend=args.backend,
+        storage=args.storage,
+        rescore=args.rescore or None,
+        **({"n_probe": args.n_probe} if args.backend == "ivf" else {}),
+    )
+
+    start = time.perf_counter()
+    store.sync(files, ingestor.batches)
+    store.index  # build the ANN index as part of ingestion
+    ingest_seconds = time.perf_counter() - start
+
+    with open(args.queries) as f:
+        queries = json.load(f)
+    latencies, recalls = [], []
+    for item in queries:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            docs = search(store, item["query"], args.k, args.mode)
+            latencies.append(time.perf_counter() - start)
+        context = [normalize(doc.page_content) for doc in docs]
+        found = [any(normalize(e) in c for c in context) for e in item["expected"]]
+        recalls.append(sum(found) / len(found))
+
+    # fan-out: all queries scored together (dense part of `retrieve_many`)
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        store.similarity_search_many([item["query"] for item in queries], k=args.k)
+    batched = (time.perf_counter() - start) / (args.repeat * len(queries))
+
+    return {
+        "mode": args.mode,
+        "backend": args.backend,
+        "storage": args.storage,
+        "chunk_size": args.chunk_size,
+        "chunk_overlap": args.chunk_overlap,
+        "files": len(files),
+        "chunks": len(store),
+        "ingest_s": ingest_seconds,
+        "pages_per_s": ingestor.stats.pages / max(ingestor.stats.elapsed, 1e-9),
+        "index_memory_mb": index_memory(store) / 2**20,
+        "index_disk_mb": disk_usage(index_dir) / 2**20,
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+        "batched_ms_per_query": 1000 * batched,
+        f"recall@{args.k}": float(np.mean(recalls)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pdf-folder", default="data/knowledge_base")
+    parser.add_argument("--queries", default="data/rag_queries.json")
+    parser.add_argument("--mode", choices=["dense", "lexical", "hybrid"], default="hybrid")
+    parser.add_argument("--backend", choices=["auto", "exact", "ivf"], default="auto")
+    parser.add_argument("--n-probe", type=int, default=8)
+    parser.add_argument("--storage", choices=["float32", "float16", "int8"], default="float32")
+    parser.add_argument("--rescore", type=int, default=32, help="candidates re-scored exactly (0: off)")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per query for latency")
+    parser.add_argument("--index-dir", help="reuse an index directory instead of a fresh one")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    if args.index_dir:
+        result = run(args, args.index_dir)
+    else:
+        with tempfile.TemporaryDirectory() as index_dir:
+            result = run(args, index_dir)
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            print(f"{key:>20}: {value:.3f}" if isinstance(value, float) else f"{key:>20}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Benchmark: model round trips of the ReAct agent of `src/04_react.py` (`build_agent` in
+`react_async.py`) with step-wise arithmetic tools (`add`, `subtract`, `multiply`,
+`divide`) versus the batched `calculate` tool (`calculator.py`).
+
+Each tool call of the step-wise tools resolves one node of the expression tree, so the
+agent needs one model call per level of the tree (plus the final answer) even when the
+model issues all independent calls of a level at once. With `calculate` it needs two.
+
+By default the agent is driven by a scripted model that parses the expression and, in
+every turn, calls the tools for all operations whose operands are known ("step-wise",
+the best case for the step-wise tools) or for only one of them ("sequential", one model
+call per operation, which is what many models do). `--live` uses the model from `llm.py`
+instead. `--latency` adds a delay per model call to estimate the wall time.
+
+Usage (from the `exercises/` folder):
+
+    python bench_react.py --latency 1.0
+    python bench_react.py --live
+"""
+
+import argparse
+import ast
+import time
+from typing import Any
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+
+from calculator import calculate, evaluate, format_number
+from react_async import build_agent
+
+QUERIES = [
+    "Calculate ((144 / 12) * (25 + 75)) / ((10 * 10) / (500 / 5)) + ((81 / 9) * (121 / 11))",
+    "Calculate (3 + 4) * (5 + 6)",
+    "Calculate ((2 * 3) + (4 * 5)) * ((6 - 1) * (7 + 8)) - 100 / 4",
+]
+
+
+@tool
+def add(a: float, b: float) -> float:
+    """Adds `a` and `b`."""
+    return a + b
+
+
+@tool
+def subtract(a: float, b: float) -> float:
+    """Subtracts `b` from `a`."""
+    return a - b
+
+
+@tool
+def multiply(a: float, b: float) -> float:
+    """Multiply `a` and `b`."""
+    return a * b
+
+
+@tool
+def divide(a: float, b: float) -> float:
+    """Divide `a` by `b`."""
+    return a / b
+
+
+STEP_TOOLS = [add, subtract, multiply, divide]
+_OPS = {ast.Add: "add", ast.Sub: "subtract", ast.Mult: "multiply", ast.Div: "divide"}
+
+
+class ScriptedMathModel(BaseChatModel):
+    """
+    Solves "Calculate <expression>" with the bound tools, calling all ready operations
+    of the expression tree in each turn (or `calculate` once, if it's bound).
+    """
+
+    latency: float = 0.0
+    parallel: bool = True  # call all ready operations in one turn
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-math"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tool_names=[t.name for t in tools])
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        tool_names: list[str] | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, tool_names))])
+
+    def _reply(self, messages: list[BaseMessage], tool_names: list[str] | None) -> AIMessage:
+        question = next(m for m in messages if m.type == "human").text
+        expression = question.split("Calculate", 1)[-1].strip()
+        results = {m.tool_call_id: m.text for m in messages if isinstance(m, ToolMessage)}
+
+        if "calculate" in (tool_names or []):
+            if "calc" in results:
+                return AIMessage(f"Final answer: {results['calc'].split(' = ')[-1]}")
+            call = {"name": "calculate", "args": {"expressions": [expression]}, "id": "calc"}
+            return AIMessage("", tool_calls=[call])
+
+        # number the operations in post-order; an operation is known once its tool
+        # call (id `n<index>`) has answered
+        nodes: list[ast.BinOp] = []
+
+        def number(node: ast.AST):
+            if isinstance(node, ast.BinOp):
+                number(node.left)
+                number(node.right)
+                nodes.append(node)
+
+        root = ast.parse(expression, mode="eval").body
+        number(root)
+
+        def value(node: ast.AST) -> float | None:
+            if isinstance(node, ast.Constant):
+                return node.value
+            if isinstance(node, ast.UnaryOp):
+                operand = value(node.operand)
+                return None if operand is None else -operand
+            result = results.get(f"n{nodes.index(node)}")
+            return None if result is None else float(result)
+
+        if value(root) is not None:
+            return AIMessage(f"Final answer: {value(root):g}")
+        calls = []
+        for i, node in enumerate(nodes):
+            left, right = value(node.left), value(node.right)
+            if f"n{i}" not in results and left is not None and right is not None:
+                args = {"a": left, "b": right}
+                calls.append({"name": _OPS[type(node.op)], "args": args, "id": f"n{i}"})
+        return AIMessage("", tool_calls=calls if self.parallel else calls[:1])
+
+
+def run(agent, query: str) -> dict:
+    started = time.perf_counter()
+    state = agent.invoke({"messages": [("user", query)]}, {"recursion_limit": 100})
+    tool_calls = sum(len(getattr(m, "tool_calls", [])) for m in state["messages"])
+    return {
+        "llm_calls": state["llm_calls"],
+        "tool_calls": tool_calls,
+        "seconds": time.perf_counter() - started,
+        "answer": state["messages"][-1].text.strip().splitlines()[-1][:40],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--live", action="store_true", help="use the model from llm.py")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per model call")
+    args = parser.parse_args()
+
+    if args.live:
+        from llm import model
+
+        agents = {"step-wise": build_agent(model, STEP_TOOLS, timeout=None)}
+    else:
+        model = ScriptedMathModel(latency=args.latency)
+        sequential = ScriptedMathModel(latency=args.latency, parallel=False)
+        agents = {
+            "sequential": build_agent(sequential, STEP_TOOLS, timeout=None),
+            "step-wise": build_agent(model, STEP_TOOLS, timeout=None),
+        }
+    agents["calculate"] = build_agent(model, [calculate], timeout=None)
+    print(f"{'tools':>10} {'llm_calls':>9} {'tool_calls':>10} {'seconds':>8}  answer (expected)")
+    totals = {name: 0 for name in agents}
+    for query in QUERIES:
+        expected = format_number(evaluate(query.split("Calculate", 1)[-1]))
+        print(query)
+        for name, agent in agents.items():
+            result = run(agent, query)
+            totals[name] += result["llm_calls"]
+            print(
+                f"{name:>10} {result['llm_calls']:>9} {result['tool_calls']:>10}"
+                f" {result['seconds']:>8.2f}  {result['answer']} ({expected})"
+            )
+    for name in agents:
+        if name != "calculate":
+            saved = 1 - totals["calculate"] / totals[name]
+            print(
+                f"llm_calls: {totals[name]} {name}, {totals['calculate']} calculate"
+                f" ({saved:.0%} fewer)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+A compact in-process BM25 index, used next to the embeddings for hybrid retrieval.
+
+Dense retrieval ranks exact identifiers such as product codes ("BYK-3441") poorly, while
+a lexical index finds them directly. Postings are stored in CSR form as NumPy arrays:
+`docs[offsets[t]:offsets[t + 1]]` (uint32) are the documents containing term `t` and
+`tfs` (uint16) the term frequencies, i.e. 6 bytes per posting. The vocabulary is one
+UTF-8 blob (`vocab`, term `t` is `vocab[vocab_offsets[t]:vocab_offsets[t + 1]]`), so a
+term costs its length in bytes, however long the longest token (URLs, compounds) is.
+"""
+
+import re
+from array import array
+from collections import Counter
+from collections.abc import Iterable
+
+import numpy as np
+
+TOKEN = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased words; compounds like "byk-3441" are kept whole and also split up."""
+    tokens = []
+    for token in TOKEN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[-./]", token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    def __init__(
+        self,
+        vocab: np.ndarray,
+        vocab_offsets: np.ndarray,
+        offsets: np.ndarray,
+        docs: np.ndarray,
+        tfs: np.ndarray,
+        doc_ids: np.ndarray,
+        doc_len: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.vocab = vocab
+        self.vocab_offsets = vocab_offsets
+        blob, bounds = vocab.tobytes(), vocab_offsets.tolist()
+        self.term_ids = {
+            blob[start:end].decode(): i for i, (start, end) in enumerate(zip(bounds, bounds[1:]))
+        }
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_ids = doc_ids
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        n = len(doc_ids)
+        df = np.diff(offsets)
+        self.idf = np.log(1 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avg_len = doc_len.mean() if n else 1.0
+        # per-document part of the BM25 denominator
+        self.norm = (k1 * (1 - b + b * doc_len / avg_len)).astype(np.float32)
+
+    @classmethod
+    def build(cls, items: Iterable[tuple[int, str]], **kwargs) -> "BM25Index":
+        """Index `(doc_id, text)` pairs (e.g. streamed from the chunk table)."""
+        term_ids: dict[str, int] = {}
+        postings: list[tuple[array, array]] = []
+        doc_ids = array("q")
+        doc_len = array("I")
+        for doc_id, text in items:
+            doc = len(doc_ids)
+            tokens = tokenize(text)
+            doc_ids.append(doc_id)
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                t = term_ids.setdefault(term, len(term_ids))
+                if t == len(postings):
+                    postings.append((array("I"), array("H")))
+                postings[t][0].append(doc)
+                postings[t][1].append(min(tf, 0xFFFF))
+
+        order = sorted(term_ids, key=term_ids.get)
+        lengths = np.array([len(postings[term_ids[t]][0]) for t in order], dtype=np.int64)
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        docs = np.empty(offsets[-1], dtype=np.uint32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(order):
+            term_docs, term_tfs = postings[term_ids[term]]
+            docs[offsets[i] : offsets[i + 1]] = term_docs
+            tfs[offsets[i] : offsets[i + 1]] = term_tfs
+        encoded = [term.encode() for term in order]
+        vocab_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=vocab_offsets[1:])
+        return cls(
+            np.frombuffer(b"".join(encoded), dtype=np.uint8).copy(),
+            vocab_offsets,
+            offsets,
+            docs,
+            tfs,
+            np.frombuffer(doc_ids, dtype=np.int64).copy(),
+            np.frombuffer(doc_len, dtype=np.uint32).astype(np.float32),
+            **kwargs,
+        )
+
+    @classmethod
+    def from_state(cls, state: dict, **kwargs) -> "BM25Index | None":
+        """The index saved with `state()`, or None if it was saved in an older format."""
+        if "vocab_offsets" not in state:
+            return None
+        return cls(**state, **kwargs)
+
+    def state(self) -> dict:
+        return {
+            "vocab": self.vocab,
+            "vocab_offsets": self.vocab_offsets,
+            "offsets": self.offsets,
+            "docs": self.docs,
+            "tfs": self.tfs,
+            "doc_ids": self.doc_ids,
+            "doc_len": self.doc_len,
+        }
+
+    def search(self, query: str, k: int = 4) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k `(doc_ids, scores)` for a query."""
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.term_ids.get(term)
+            if t is None:
+                continue
+            docs = self.docs[self.offsets[t] : self.offsets[t + 1]]
+            tfs = self.tfs[self.offsets[t] : self.offsets[t + 1]].astype(np.float32)
+            scores[docs] += self.idf[t] * tfs * (self.k1 + 1) / (tfs + self.norm[docs])
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = hits[np.argsort(-scores[hits], kind="stable")[:k]]
+        return self.doc_ids[top], scores[top]
+
+
+def reciprocal_rank_fusion(rankings: list[list], k: int = 60) -> list:
+    """
+    Merge ranked lists of documents (by `doc.id`): each list contributes
+    `1 / (k + rank)` to a document's score.
+    """
+    scores: dict[str, float] = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc.id] = scores.get(doc.id, 0.0) + 1.0 / (k + rank + 1)
+            docs.setdefault(doc.id, doc)
+    return [docs[i] for i in sorted(scores, key=scores.get, reverse=True)]
@@ -0,0 +1,128 @@
+"""
+A safe, exact arithmetic engine exposed as one tool.
+
+With tools like `add(a, b)` and `multiply(a, b)`, evaluating a nested expression takes
+the agent one model round trip per level of the expression tree. `calculate` takes whole
+expressions instead, and a batch of independent ones at once, so the model can finish
+in a single tool call.
+
+Expressions are parsed with `ast` and only numbers, parentheses, `+ - * / // % **` and
+unary signs are accepted; nothing is ever `eval`ed. Arithmetic is exact (`Fraction`):
+`0.1 + 0.2` is `3/10`, and `1 / 3 * 3` is `1`. Errors (division by zero, unsupported
+syntax, exponents that are too large) are reported per expression.
+
+    >>> evaluate("((144 / 12) * (25 + 75)) / ((10 * 10) / (500 / 5))")
+    Fraction(1200, 1)
+"""
+
+import ast
+import math
+from fractions import Fraction
+
+from langchain_core.tools import tool
+
+from tool_cache import cacheable
+
+MAX_LENGTH = 10_000  # characters per expression
+MAX_EXPONENT = 1_000
+MAX_DIGITS = 10_000  # of an intermediate numerator or denominator
+_MAX_BITS = int(MAX_DIGITS * 3.33)
+
+
+class CalculationError(ValueError):
+    """An expression that can't be evaluated, with the reason."""
+
+
+_BINARY = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+    ast.FloorDiv: lambda a, b: Fraction(a // b),
+    ast.Mod: lambda a, b: a % b,
+}
+
+
+def _bits(value: Fraction) -> int:
+    return max(abs(value.numerator), value.denominator).bit_length()
+
+
+def _check_size(value: Fraction) -> Fraction:
+    if _bits(value) > _MAX_BITS:
+        raise CalculationError(f"result too large (more than {MAX_DIGITS} digits)")
+    return value
+
+
+def _power(base: Fraction, exponent: Fraction) -> Fraction:
+    if exponent.denominator != 1:
+        raise CalculationError("only integer exponents are supported")
+    if abs(exponent) > MAX_EXPONENT:
+        raise CalculationError(f"exponent {exponent} is larger than {MAX_EXPONENT}")
+    if base == 0 and exponent < 0:
+        raise CalculationError("division by zero")
+    # estimate the size before computing it
+    if (_bits(base) - 1) * abs(exponent) > _MAX_BITS:
+        raise CalculationError(f"result too large (more than {MAX_DIGITS} digits)")
+    return base ** int(exponent)
+
+
+def _eval(node: ast.AST, source: str) -> Fraction:
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        return _check_size(Fraction(node.value))
+    if isinstance(node, ast.Constant) and type(node.value) is float:
+        if not math.isfinite(node.value):
+            raise CalculationError(f"number out of range: {ast.get_source_segment(source, node)}")
+        # decimal literals are exact: 0.1 is 1/10
+        return _check_size(Fraction(repr(node.value)))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        value = _eval(node.operand, source)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp) and (type(node.op) in _BINARY or isinstance(node.op, ast.Pow)):
+        left, right = _eval(node.left, source), _eval(node.right, source)
+        if isinstance(node.op, ast.Pow):
+            return _check_size(_power(left, right))
+        if right == 0 and isinstance(node.op, (ast.Div, ast.FloorDiv, ast.Mod)):
+            segment = ast.get_source_segment(source, node.right) or "0"
+            raise CalculationError(f"division by zero ({segment} is 0)")
+        return _check_size(_BINARY[type(node.op)](left, right))
+    segment = ast.get_source_segment(source, node) or type(node).__name__
+    raise CalculationError(f"unsupported syntax: {segment}")
+
+
+def evaluate(expression: str) -> Fraction:
+    """The exact value of an arithmetic expression; raises `CalculationError`."""
+    if len(expression) > MAX_LENGTH:
+        raise CalculationError(f"expression longer than {MAX_LENGTH} characters")
+    # accept the usual ways of writing multiplication, division and powers
+    source = expression.replace("×", "*").replace("÷", "/").replace("^", "**").strip()
+    try:
+        return _eval(ast.parse(source, mode="eval").body, source)
+    except SyntaxError as e:
+        raise CalculationError(f"invalid expression: {e.msg}") from None
+    except RecursionError:
+        raise CalculationError("expression nested too deeply") from None
+
+
+def format_number(value: Fraction) -> str:
+    """`12`, or `7/3 (≈ 2.333333333)` for non-integers."""
+    if value.denominator == 1:
+        return str(value.numerator)
+    return f"{value} (≈ {float(value):.10g})"
+
+
+@cacheable()
+@tool
+def calculate(expressions: list[str]) -> str:
+    """
+    Evaluate arithmetic expressions exactly, e.g. ["(144 / 12) * (25 + 75)", "2 ** 10"].
+
+    Pass the whole expression instead of single steps, and all independent expressions
+    of a task in one call. Supports + - * / // % ** and parentheses.
+    """
+    lines = []
+    for i, expression in enumerate(expressions, 1):
+        try:
+            lines.append(f"{i}. {expression} = {format_number(evaluate(expression))}")
+        except CalculationError as e:
+            lines.append(f"{i}. {expression}: error: {e}")
+    return "\n".join(lines)
@@ -0,0 +1,127 @@
+"""
+Bounded chat history with a rolling summary.
+
+`ChatHistory` keeps the most recent turns within a token budget (`max_tokens`). Older
+turns are folded into a running summary by the model in a background thread, so a
+reply never waits for summarization; until a summary update has finished, the turns it
+covers are still sent verbatim. The prompt for each turn is then
+
+    [summary of older turns] + recent turns
+
+so per-turn latency and cost stay flat in long sessions.
+
+The module only depends on `langchain_core`, so it can be copied next to an app.
+"""
+
+import contextvars
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, get_buffer_string
+
+SUMMARY_PROMPT = """Update the summary of a conversation between a user and an AI assistant.
+Keep facts, names, numbers, decisions and open questions; drop small talk. Use at most
+{words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:"""
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+class ChatHistory:
+    def __init__(
+        self,
+        model: BaseChatModel,
+        max_tokens: int = 2000,
+        summary_words: int = 200,
+        count_tokens: Callable[[str], int] = approx_tokens,
+    ):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.summary_words = summary_words
+        self.count_tokens = count_tokens
+        self.summary = ""
+        self._recent: list[BaseMessage] = []
+        self._pending: list[BaseMessage] = []  # evicted, not yet in the summary
+        self._tokens = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+        self._future: Future | None = None
+        self._summarizing = False  # a worker runs and will pick up new pending turns
+
+    def append(self, message: BaseMessage):
+        with self._lock:
+            self._recent.append(message)
+            self._tokens += self.count_tokens(message.text)
+            evicted = self._evict()
+            if evicted:
+                self._pending += evicted
+                if not self._summarizing:
+                    self._summarizing = True
+                    # in the caller's context, e.g. its scheduler priority
+                    context = contextvars.copy_context()
+                    self._future = self._executor.submit(context.run, self._summarize)
+
+    def _evict(self) -> list[BaseMessage]:
+        """Drop whole turns (from a user message to the next) until within the budget."""
+        evicted = []
+        while self._tokens > self.max_tokens:
+            # the next turn starts at the second user message; keep at least the last turn
+            starts = [i for i, m in enumerate(self._recent) if isinstance(m, HumanMessage)]
+            if len(starts) < 2:
+                break
+            turn, self._recent = self._recent[: starts[1]], self._recent[starts[1] :]
+            self._tokens -= sum(self.count_tokens(m.text) for m in turn)
+            evicted += turn
+        return evicted
+
+    def _summarize(self):
+        # runs until all evicted turns (also those evicted meanwhile) are summarized; the
+        # flag is cleared under the lock, so an `append` either sees it set and leaves its
+        # turns to this loop, or starts a new worker
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._summarizing = False
+                    return
+                summary, messages = self.summary, list(self._pending)
+            prompt = SUMMARY_PROMPT.format(
+                words=self.summary_words,
+                summary=summary or "(empty)",
+                messages=get_buffer_string(messages),
+            )
+            try:
+                response = self.model.invoke(prompt)
+            except BaseException:
+                with self._lock:
+                    self._summarizing = False  # the next eviction retries
+                raise
+            with self._lock:
+                self.summary = response.text.strip()
+                del self._pending[: len(messages)]
+
+    def to_messages(self) -> list[BaseMessage]:
+        """The messages to send to the model: summary, unsummarized and recent turns."""
+        with self._lock:
+            messages = list(self._pending) + list(self._recent)
+            if self.summary:
+                summary = f"Summary of the earlier conversation:\n{self.summary}"
+                messages.insert(0, SystemMessage(summary))
+            return messages
+
+    def wait(self):
+        """Block until the background summarization has caught up."""
+        future = self._future
+        if future is not None:
+            future.result()
@@ -0,0 +1,295 @@
+"""
+An asyncio chat service: the chatbot of `src/01_chatbot.py` for many users at once.
+
+Every session's history lives in a store (`MemoryStore`, `SQLiteStore` or any object
+with the same async `load` and `append` methods).
+A turn loads the latest messages of the session, trims them to `max_history_tokens`,
+streams the reply with `model.astream` (at the scheduler's `interactive` priority) and
+appends both messages to the store. Turns of one session run one at a time
+(`max_pending` more may wait, further ones are rejected), while different sessions run
+concurrently on one event loop, without a thread per user. All model calls of the process
+share one scheduler, which runs at most `LLM_MAX_IN_FLIGHT` (default 16) at a time; set it
+to the number of replies that should stream at once (the load test raises it itself).
+
+Usage (from the `exercises/` folder):
+
+    LLM_MAX_IN_FLIGHT=64 python chat_server.py serve --port 8080 --store sqlite
+    curl -N -X POST localhost:8080/sessions/alice/messages -d "Hi, I'm Alice"
+
+    # load test with the offline model (no network)
+    python chat_server.py load-test --sessions 500 --turns 3 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterator
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    message_to_dict,
+    messages_from_dict,
+    trim_messages,
+)
+
+from scheduler import priority
+
+
+def approx_tokens(messages: list[BaseMessage]) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return sum(len(message.text) for message in messages) // 4
+
+
+class SessionBusy(Exception):
+    """Too many turns of one session are running or waiting."""
+
+
+class MemoryStore:
+    def __init__(self):
+        self.sessions: dict[str, list[BaseMessage]] = {}
+
+    async def load(self, session_id: str, limit: int) -> list[BaseMessage]:
+        return self.sessions.get(session_id, [])[-limit:]
+
+    async def append(self, session_id: str, messages: list[BaseMessage]):
+        self.sessions.setdefault(session_id, []).extend(messages)
+
+
+class SQLiteStore:
+    """Sessions in SQLite; queries run in the default executor, off the event loop."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS messages (
+        session TEXT NOT NULL,
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        message TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS messages_session ON messages (session, seq);
+    """
+
+    def __init__(self, path: str = ".cache/chat_sessions.sqlite"):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+
+    def _load(self, session_id: str, limit: int) -> list[BaseMessage]:
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT message FROM messages WHERE session = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, limit),
+            ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in reversed(rows)])
+
+    def _append(self, session_id: str, messages: list[BaseMessage]):
+        rows = [(session_id, json.dumps(message_to_dict(m))) for m in messages]
+        with self._lock, self.db:
+            self.db.executemany("INSERT INTO messages (session, message) VALUES (?, ?)", rows)
+
+    async def load(self, session_id: str, limit: int) -> list[BaseMessage]:
+        return await asyncio.to_thread(self._load, session_id, limit)
+
+    async def append(self, session_id: str, messages: list[BaseMessage]):
+        await asyncio.to_thread(self._append, session_id, messages)
+
+
+class _Session:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiting = 0
+
+
+class ChatService:
+    def __init__(
+        self,
+        model: BaseChatModel,
+        store: MemoryStore | SQLiteStore,
+        system_prompt: str = "You are a helpful assistant.",
+        max_history_tokens: int = 2000,
+        max_history_messages: int = 100,
+        max_pending: int = 2,
+    ):
+        self.model = model
+        self.store = store
+        self.system_prompt = system_prompt
+        self.max_history_tokens = max_history_tokens
+        self.max_history_messages = max_history_messages
+        self.max_pending = max_pending
+        self.sessions: dict[str, _Session] = {}
+        self.active_turns = 0
+        self.rejected = 0
+
+    async def chat(self, session_id: str, text: str) -> AsyncIterator[str]:
+        """Stream the reply to `text` in session `session_id`."""
+        session = self.sessions.setdefault(session_id, _Session())
+        if session.waiting > self.max_pending:
+            self.rejected += 1
+            raise SessionBusy(f"Session '{session_id}' has too many pending messages.")
+        session.waiting += 1
+        try:
+            async with session.lock:
+                self.active_turns += 1
+                try:
+                    async for token in self._turn(session_id, text):
+                        yield token
+                finally:
+                    self.active_turns -= 1
+        finally:
+            session.waiting -= 1
+            if not session.waiting:
+                del self.sessions[session_id]
+
+    async def _turn(self, session_id: str, text: str) -> AsyncIterator[str]:
+        history = await self.store.load(session_id, self.max_history_messages)
+        question = HumanMessage(text)
+        history = trim_messages(
+            history + [question],
+            max_tokens=self.max_history_tokens,
+            token_counter=approx_tokens,
+            strategy="last",
+            start_on="human",
+        )
+        # a question longer than the budget on its own is still sent, without history
+        history = history or [question]
+        parts = []
+        # a user is waiting: admitted before normal and batch calls (see `scheduler.py`)
+        with priority("interactive"):
+            messages = [SystemMessage(self.system_prompt)] + history
+            async for chunk in self.model.astream(messages):
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+        await self.store.append(session_id, [question, AIMessage("".join(parts))])
+
+    async def history(self, session_id: str) -> list[BaseMessage]:
+        return await self.store.load(session_id, self.max_history_messages)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "active_turns": self.active_turns,
+            "rejected": self.rejected,
+        }
+
+
+def make_app(service: ChatService):
+    """An aiohttp app: POST a message to stream the reply, GET the history."""
+    from aiohttp import web
+
+    async def post_message(request: web.Request) -> web.StreamResponse:
+        session_id, text = request.match_info["session"], await request.text()
+        response = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+        stream = service.chat(session_id, text)
+        try:
+            first = await anext(stream, "")
+        except SessionBusy as e:
+            raise web.HTTPTooManyRequests(text=str(e))
+        try:
+            await response.prepare(request)
+            await response.write(first.encode())
+            async for token in stream:
+                await response.write(token.encode())
+            await response.write_eof()
+        finally:
+            await stream.aclose()  # also when the client disconnects
+        return response
+
+    async def get_history(request: web.Request) -> web.Response:
+        messages = await service.history(request.match_info["session"])
+        return web.json_response([{"role": m.type, "content": m.text} for m in messages])
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(service.stats())
+
+    app = web.Application()
+    app.router.add_post("/sessions/{session}/messages", post_message)
+    app.router.add_get("/sessions/{session}/messages", get_history)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def make_store(kind: str, path: str) -> MemoryStore | SQLiteStore:
+    return SQLiteStore(path) if kind == "sqlite" else MemoryStore()
+
+
+async def load_test(service: ChatService, sessions: int, turns: int, think_time: float) -> dict:
+    """`sessions` concurrent users, each sending `turns` messages."""
+    ttfts, latencies = [], []
+
+    async def user(i: int):
+        for turn in range(turns):
+            started = time.perf_counter()
+            first = None
+            async for _ in service.chat(f"user-{i}", f"Message {turn} from user {i}: 2 + {i}?"):
+                first = first or time.perf_counter() - started
+            ttfts.append(first or 0.0)
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(think_time)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - started
+
+    def percentile(values, q):
+        return sorted(values)[min(len(values) - 1, int(q / 100 * len(values)))]
+
+    return {
+        "sessions": sessions,
+        "turns": len(latencies),
+        "elapsed_s": elapsed,
+        "turns_per_s": len(latencies) / elapsed,
+        "ttft_p50_ms": 1000 * percentile(ttfts, 50),
+        "ttft_p95_ms": 1000 * percentile(ttfts, 95),
+        "latency_p50_ms": 1000 * percentile(latencies, 50),
+        "latency_p95_ms": 1000 * percentile(latencies, 95),
+        "threads": threading.active_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["serve", "load-test"])
+    parser.add_argument("--store", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--store-path", default=".cache/chat_sessions.sqlite")
+    parser.add_argument("--max-pending", type=int, default=2)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--sessions", type=int, default=200, help="load test: concurrent users")
+    parser.add_argument("--turns", type=int, default=3, help="load test: messages per user")
+    parser.add_argument("--think-time", type=float, default=0.1)
+    parser.add_argument("--latency", type=float, default=0.5, help="load test: fake model latency")
+    args = parser.parse_args()
+
+    if args.command == "load-test":
+        # the offline model, and no in-flight cap below the number of users
+        os.environ["LLM_BACKEND"] = "fake"
+        os.environ["LLM_FAKE_LATENCY"] = str(args.latency)
+        os.environ.setdefault("LLM_FAKE_CHUNK_LATENCY", "0.005")
+        os.environ.setdefault("LLM_MAX_IN_FLIGHT", str(max(args.sessions, 16)))
+    from llm import model
+
+    service = ChatService(
+        model, make_store(args.store, args.store_path), max_pending=args.max_pending
+    )
+    if args.command == "serve":
+        from aiohttp import web
+
+        web.run_app(make_app(service), host=args.host, port=args.port)
+    else:
+        result = asyncio.run(load_test(service, args.sessions, args.turns, args.think_time))
+        for key, value in result.items():
+            print(f"{key:>16}: {value:.3f}" if isinstance(value, float) else f"{key:>16}: {value}")
+
+
+if __name__ == "__main__":
+    main()
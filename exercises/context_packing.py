@@ -0,0 +1,107 @@
+"""
+Token-budgeted context packing for RAG prompts.
+
+Retrieved chunks overlap (the splitter uses `chunk_overlap`) and are often neighbours on
+the same page. `pack_context` merges overlapping or adjacent chunks from the same page
+into one segment, drops duplicates and then fills a token budget with the segments in
+relevance order, so the prompt is shorter and never exceeds the budget.
+"""
+
+import re
+from collections.abc import Callable
+
+from langchain_core.documents import Document
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _merge_text(a: str, b: str, min_overlap: int = 20) -> str | None:
+    """`a` followed by the rest of `b` if `b` starts with a suffix of `a`, else None."""
+    tail = a[-min_overlap:]
+    if len(tail) < min_overlap:
+        return None
+    pos = b.find(tail)
+    while pos != -1:
+        overlap = pos + len(tail)
+        if a.endswith(b[:overlap]):
+            return a + b[overlap:]
+        pos = b.find(tail, pos + 1)
+    return None
+
+
+class _Segment:
+    def __init__(self, doc: Document, rank: int):
+        self.text = doc.page_content
+        self.rank = rank
+        self.start = doc.metadata.get("start_index")
+        self.end = self.start + len(self.text) if self.start is not None else None
+
+    def absorb(self, other: "_Segment") -> bool:
+        """Merge `other` into this segment if the two overlap or touch."""
+        if self.start is not None and other.start is not None:
+            first, second = (self, other) if self.start <= other.start else (other, self)
+            if second.start > first.end:
+                return False
+            text = first.text + second.text[first.end - second.start :]
+            self.text, self.start, self.end = text, first.start, max(first.end, second.end)
+        else:
+            text = _merge_text(self.text, other.text) or _merge_text(other.text, self.text)
+            if text is None:
+                return False
+            self.text = text
+        self.rank = min(self.rank, other.rank)
+        return True
+
+
+def pack_context(
+    docs: list[Document],
+    max_tokens: int = 2000,
+    count_tokens: Callable[[str], int] = approx_tokens,
+    separator: str = "\n\n",
+) -> str:
+    """
+    Pack `docs` (best first) into at most `max_tokens` tokens of context.
+
+    Chunks are merged per `(source, page)` using their `start_index` metadata (set by a
+    splitter with `add_start_index=True`), or by detecting the overlapping text.
+    """
+    groups: dict[tuple, list[_Segment]] = {}
+    for rank, doc in enumerate(docs):
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        segment = _Segment(doc, rank)
+        merged = True
+        while merged:
+            # a merged segment may now bridge the gap to another segment of the page
+            merged = False
+            for other in groups.get(key, []):
+                if other.absorb(segment):
+                    groups[key].remove(other)
+                    segment, merged = other, True
+                    break
+        groups.setdefault(key, []).append(segment)
+
+    segments = sorted((s for group in groups.values() for s in group), key=lambda s: s.rank)
+    packed, seen, used = [], [], 0
+    for segment in segments:
+        text = _normalize(segment.text)
+        if any(text in other for other in seen):
+            continue
+        seen.append(text)
+        cost = count_tokens(segment.text + separator)
+        if used + cost > max_tokens:
+            remaining = max_tokens - used
+            if remaining < 50:
+                break
+            # truncate the last segment to the remaining budget
+            segment.text = segment.text[: int(len(segment.text) * remaining / cost)]
+            cost = remaining
+        packed.append(segment.text)
+        used += cost
+    return separator.join(packed)
@@ -0,0 +1,231 @@
+"""
+A persistent cache in front of an `Embeddings` model.
+
+Texts are keyed by the hash of their normalized form (Unicode NFKC, collapsed
+whitespace), so repeated or near-identical chunks are only embedded once. Misses are
+de-duplicated and sent to the wrapped model in large `embed_documents` batches.
+Vectors are stored as float32 blobs in SQLite; when the cache grows beyond `max_bytes`
+the least recently used entries are evicted. Keys include a `namespace`, by default the
+model's `embedding_id`, so models sharing a cache file never share vectors.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def embedding_id(embeddings: Embeddings) -> str:
+    """
+    The model behind `embeddings`, looking through wrappers: its `model_id` if it has
+    one (`LazyEmbeddings`), else the class and the model, endpoint and size settings.
+    """
+    if getattr(embeddings, "model_id", None):
+        return embeddings.model_id
+    if isinstance(getattr(embeddings, "embeddings", None), Embeddings):
+        return embedding_id(embeddings.embeddings)  # `CachedEmbeddings`, metrics wrapper
+    settings = [
+        getattr(embeddings, name, None)
+        for name in (
+            "azure_endpoint", "endpoint", "deployment", "model", "model_name", "dimensions"
+        )
+    ]
+    return ":".join([type(embeddings).__name__, *(str(s) for s in settings if s is not None)])
+
+
+# models whose `embed_query(text)` is `embed_documents([text])[0]`
+SYMMETRIC = {"HashingEmbeddings", "OpenAIEmbeddings"}
+
+
+def embed_queries(embeddings: Embeddings, texts: list[str]) -> list[list[float]]:
+    """
+    Query embeddings of `texts`, as `embed_query` would return them, in as few calls as
+    possible: with the batch method of the wrappers in this folder, one `embed_documents`
+    call for symmetric models, else concurrent `embed_query` calls.
+
+    >>> class Model(Embeddings):
+    ...     calls = 0
+    ...     def embed_documents(self, texts):
+    ...         Model.calls += 1
+    ...         return [[float(len(text))] for text in texts]
+    ...     def embed_query(self, text):
+    ...         return self.embed_documents([text])[0]
+    >>> SYMMETRIC.add("Model")
+    >>> embed_queries(Model(), ["a", "bb", "ccc"]), Model.calls
+    ([[1.0], [2.0], [3.0]], 1)
+    >>> SYMMETRIC.discard("Model")
+    """
+    if not texts:
+        return []
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    classes = {cls.__name__ for cls in type(embeddings).__mro__}
+    if classes & SYMMETRIC or (
+        "DatabricksEmbeddings" in classes
+        and embeddings.query_params == embeddings.documents_params
+    ):
+        return embeddings.embed_documents(list(texts))
+    with ThreadPoolExecutor(min(8, len(texts))) as executor:
+        return list(executor.map(embeddings.embed_query, texts))
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an `Embeddings` model with a de-duplicating SQLite cache."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        path: str = ".cache/embeddings.sqlite",
+        namespace: str = "",
+        max_bytes: int = 512 * 2**20,
+        batch_size: int = 512,
+    ):
+        self.embeddings = embeddings
+        self.namespace = namespace or embedding_id(embeddings)
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._last_call = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._size = self.db.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def key(self, text: str, kind: str = "document") -> str:
+        data = f"{self.namespace}\0{kind}\0{normalize_text(text)}"
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    @property
+    def last_call_hits(self) -> int:
+        """Cache hits of the calling thread's last `embed_*` call."""
+        return getattr(self._last_call, "hits", 0)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "entries": self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0],
+            "bytes": self._size,
+        }
+
+    def _lookup(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        # stay below SQLite's limit on the number of query parameters
+        for i in range(0, len(keys), 500):
+            part = keys[i : i + 500]
+            marks = ",".join("?" * len(part))
+            rows = self.db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+            )
+            found.update(
+                (key, np.frombuffer(blob, dtype=np.float32).tolist()) for key, blob in rows
+            )
+        if found:
+            now = time.time()
+            with self.db:
+                self.db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+        return found
+
+    def _store(self, items: dict[str, list[float]]):
+        now = time.time()
+        rows = [
+            (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        # a replaced row no longer counts (concurrent misses may embed the same text)
+        replaced = 0
+        keys = list(items)
+        for i in range(0, len(keys), 500):
+            part = keys[i : i + 500]
+            marks = ",".join("?" * len(part))
+            replaced += self.db.execute(
+                f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({marks})",
+                part,
+            ).fetchone()[0]
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                rows,
+            )
+        self._size += sum(len(blob) for _, blob, _ in rows) - replaced
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is at 90% of `max_bytes`."""
+        target = int(self.max_bytes * 0.9)
+        with self.db:
+            for key, size in self.db.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used"
+            ).fetchall():
+                if self._size <= target:
+                    break
+                self.db.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self._size -= size
+
+    def _embed(self, texts: list[str], kind: str, embed) -> list[list[float]]:
+        keys = [self.key(text, kind) for text in texts]
+        with self._lock:
+            cached = self._lookup(list(set(keys)))
+            n_missing = sum(key not in cached for key in keys)
+            self.hits += len(keys) - n_missing
+            self.misses += n_missing
+        self._last_call.hits = len(keys) - n_missing
+
+        # one representative text per missing key, embedded in large batches
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        missing_keys = list(missing)
+        for i in range(0, len(missing_keys), self.batch_size):
+            batch = missing_keys[i : i + self.batch_size]
+            new = dict(zip(batch, embed([missing[k] for k in batch])))
+            with self._lock:
+                self._store(new)
+            cached.update(new)
+        return [cached[key] for key in keys]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, "document", self.embeddings.embed_documents)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, "query", lambda batch: embed_queries(self.embeddings, batch))
+
+    def embed_query(self, text: str) -> list[float]:
+        embed = self.embeddings.embed_query
+        return self._embed([text], "query", lambda batch: [embed(batch[0])])[0]
@@ -0,0 +1,262 @@
+"""
+Offline stand-ins for the models in `llm.py`, for benchmarks and load tests that must not
+touch the network. Select them with `LLM_BACKEND=fake` (see `llm_factory.py`).
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import re
+import time
+from collections.abc import AsyncIterator, Iterator
+from typing import Any
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+WORD = re.compile(r"\w+(?:[-.]\w+)*")
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic embeddings from signed feature hashing of words and word bigrams.
+
+    They capture lexical overlap only, but are stable across processes and machines,
+    which is what benchmarks comparing store backends or chunking settings need.
+    """
+
+    def __init__(self, dimensions: int = 1024):
+        self.dimensions = dimensions
+
+    def _bucket(self, feature: str) -> tuple[int, float]:
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dimensions, 1.0 if value >> 63 else -1.0
+
+    def embed_query(self, text: str) -> list[float]:
+        words = WORD.findall(text.lower())
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            index, sign = self._bucket(feature)
+            vector[index] += sign
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    A deterministic chat model with artificial latency.
+
+    * With `responses`, replies are taken from the list in turn (strings or `AIMessage`s).
+    * With tools bound, it first calls the tools named in the last user message (or the
+      first tool) for `tool_rounds` rounds, with arguments derived from the message and
+      the tool's schema, and then answers with the tool results. Structured output
+      (`with_structured_output`, which forces a tool call) yields schema-valid objects.
+    * Otherwise it answers with a short echo of the last message.
+
+    Every call sleeps `latency` seconds; streamed replies additionally sleep
+    `chunk_latency` per chunk (word). Usage metadata is approximate (~4 characters per
+    token).
+    """
+
+    responses: list[str | AIMessage] | None = None
+    latency: float = 0.0
+    chunk_latency: float = 0.0
+    tool_rounds: int = 1
+    _calls: Any = PrivateAttr(default_factory=itertools.count)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"model": "fake", "responses": self.responses, "tool_rounds": self.tool_rounds}
+
+    def bind_tools(self, tools, *, tool_choice: str | dict | None = None, **kwargs):
+        formatted = [convert_to_openai_tool(t) for t in tools]
+        if isinstance(tool_choice, str) and tool_choice not in ("auto", "any", "required", "none"):
+            tool_choice = {"type": "function", "function": {"name": tool_choice}}
+        return self.bind(tools=formatted, tool_choice=tool_choice, **kwargs)
+
+    # replies
+
+    def _reply(self, messages: list[BaseMessage], tools=None, tool_choice=None, **_) -> AIMessage:
+        if self.responses:
+            response = self.responses[next(self._calls) % len(self.responses)]
+            message = response if isinstance(response, AIMessage) else AIMessage(response)
+        else:
+            calls = self._tool_calls(messages, tools or [], tool_choice)
+            if calls:
+                message = AIMessage("", tool_calls=calls)
+            else:
+                message = AIMessage(self._answer(messages))
+        prompt = sum(len(_text(m)) for m in messages) // 4
+        completion = (len(_text(message)) + len(str(message.tool_calls))) // 4
+        message.usage_metadata = {
+            "input_tokens": prompt,
+            "output_tokens": completion,
+            "total_tokens": prompt + completion,
+        }
+        return message
+
+    @staticmethod
+    def _answer(messages: list[BaseMessage]) -> str:
+        results = []
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                break
+            if message.type == "tool":
+                results.append(_text(message))
+        if results:
+            return "Final answer: " + "; ".join(reversed(results))
+        last = _text(messages[-1]) if messages else ""
+        return f"Fake answer to: {' '.join(last.split()[:40])}"
+
+    def _tool_calls(self, messages: list[BaseMessage], tools: list[dict], tool_choice) -> list:
+        if not tools or tool_choice == "none":
+            return []
+        rounds, question = 0, ""
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                question = _text(message)
+                break
+            rounds += bool(getattr(message, "tool_calls", None))
+        forced = tool_choice in ("any", "required") or isinstance(tool_choice, dict)
+        if rounds >= self.tool_rounds and not (forced and rounds == 0):
+            return []
+
+        if isinstance(tool_choice, dict):
+            chosen = [t for t in tools if t["function"]["name"] == tool_choice["function"]["name"]]
+        else:
+            lower = question.lower()
+            mentioned = [t for t in tools if t["function"]["name"].lower() in lower]
+            chosen = sorted(mentioned, key=lambda t: lower.find(t["function"]["name"].lower()))
+            chosen = chosen or tools[:1]
+        numbers = [int(n) for n in re.findall(r"-?\d+", question)] or [1, 2]
+        return [
+            {
+                "name": tool["function"]["name"],
+                "args": _fake_value(tool["function"].get("parameters", {}), question, numbers),
+                "id": f"call_{i}_{hashlib.sha1(question.encode()).hexdigest()[:8]}",
+                "type": "tool_call",
+            }
+            for i, tool in enumerate(chosen)
+        ]
+
+    # model interface
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, **kwargs))])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, **kwargs))])
+
+    def _chunks(self, message: AIMessage) -> list[AIMessageChunk]:
+        if message.tool_calls:
+            return [
+                AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[
+                        {
+                            "name": call["name"],
+                            "args": json.dumps(call["args"]),
+                            "id": call["id"],
+                            "index": i,
+                        }
+                        for i, call in enumerate(message.tool_calls)
+                    ],
+                    usage_metadata=message.usage_metadata,
+                )
+            ]
+        words = re.findall(r"\S+\s*", _text(message)) or [""]
+        chunks = [AIMessageChunk(content=word) for word in words]
+        chunks[-1].usage_metadata = message.usage_metadata
+        return chunks
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages, **kwargs)):
+            time.sleep(self.chunk_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages, **kwargs)):
+            await asyncio.sleep(self.chunk_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+
+def _fake_value(schema: dict, text: str, numbers: list[int], defs: dict | None = None) -> Any:
+    """A deterministic value matching the JSON `schema` (numbers are taken from the text)."""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return _fake_value(defs[schema["$ref"].split("/")[-1]], text, numbers, defs)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return _fake_value(options[0], text, numbers, defs)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "default" in schema and schema.get("type") != "object":
+        return schema["default"]
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    if kind == "object":
+        return {
+            name: _fake_value(prop, text, numbers[i:] + numbers[:i], defs)
+            for i, (name, prop) in enumerate(schema.get("properties", {}).items())
+        }
+    if kind == "array":
+        count = max(schema.get("minItems", 3), 1)
+        item = schema.get("items", {"type": "string"})
+        return [
+            _fake_value(item, f"{text} ({i + 1})", numbers[i:] + numbers[:i], defs)
+            for i in range(count)
+        ]
+    if kind == "integer":
+        return numbers[0]
+    if kind == "number":
+        return float(numbers[0])
+    if kind == "boolean":
+        return False
+    return " ".join(text.split()[:12]) or "text"
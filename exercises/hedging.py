@@ -0,0 +1,195 @@
+"""
+Tail-latency hedging for model requests.
+
+A few slow responses dominate p99 latency. `Hedger` tracks the recent latencies of
+requests (time to the complete response, or to the first chunk for streams) and, once a
+request has run longer than their `quantile`-th percentile, sends a duplicate. Whichever
+finishes first wins; the other is cancelled (threads that already started can't be
+interrupted, their result is discarded). Hedges are capped at `max_fraction` of the
+requests.
+
+`stats()` reports the hedge rate, how often the hedge won and an estimate of the latency
+saved: for each winning hedge, the expected remaining time of the original request (the
+mean of the recorded latencies beyond its age).
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+class Hedger:
+    def __init__(
+        self,
+        quantile: float = 95,
+        max_fraction: float = 0.05,
+        min_samples: int = 20,
+        window: int = 500,
+        min_delay: float = 0.1,
+        max_workers: int = 64,
+    ):
+        self.quantile = quantile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.latency_saved = 0.0
+        self._lock = threading.Lock()
+        self._latencies: dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="hedge")
+
+    # bookkeeping
+
+    def deadline(self, kind: str) -> float | None:
+        """Seconds after which a request of `kind` is hedged (None: never)."""
+        with self._lock:
+            self.requests += 1
+            latencies = self._latencies[kind]
+            if len(latencies) < self.min_samples:
+                return None
+            return max(self.min_delay, percentile(latencies, self.quantile))
+
+    def observe(self, kind: str, latency: float):
+        with self._lock:
+            self._latencies[kind].append(latency)
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.max_fraction * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _hedge_won(self, kind: str, age: float):
+        with self._lock:
+            self.hedge_wins += 1
+            longer = [latency for latency in self._latencies[kind] if latency > age]
+            if longer:
+                self.latency_saved += sum(longer) / len(longer) - age
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_rate": self.hedges / self.requests if self.requests else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "latency_saved_s": self.latency_saved,
+            }
+
+    # execution
+
+    def _submit(self, call: Callable[[], Any]):
+        # each attempt runs in its own copy of the caller's context (priority, tracing)
+        return self._executor.submit(contextvars.copy_context().run, call)
+
+    def run(self, call: Callable[[], Any], kind: str = "generate") -> Any:
+        started = time.perf_counter()
+        deadline = self.deadline(kind)
+        if deadline is None:
+            result = call()
+            self.observe(kind, time.perf_counter() - started)
+            return result
+
+        primary = self._submit(call)
+        try:
+            result = primary.result(timeout=deadline)
+            self.observe(kind, time.perf_counter() - started)
+            return result
+        except FutureTimeout:
+            pass
+        if not self._take_hedge():
+            result = primary.result()
+            self.observe(kind, time.perf_counter() - started)
+            return result
+
+        hedge = self._submit(call)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next(iter(done))
+            if winner.exception() is None or not pending:
+                for future in pending:
+                    future.cancel()
+                if winner is hedge and pending:
+                    self._hedge_won(kind, time.perf_counter() - started)
+                self.observe(kind, time.perf_counter() - started)
+                return winner.result()
+
+    async def arun(self, call: Callable[[], Awaitable[Any]], kind: str = "generate") -> Any:
+        started = time.perf_counter()
+        deadline = self.deadline(kind)
+        primary = asyncio.ensure_future(call())
+        pending = {primary}
+        try:
+            if deadline is not None:
+                done, _ = await asyncio.wait(pending, timeout=deadline)
+                if not done and self._take_hedge():
+                    hedge = asyncio.ensure_future(call())
+                    pending.add(hedge)
+                    while True:
+                        done, pending = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+                        winner = next(iter(done))
+                        if winner.exception() is None or not pending:
+                            if winner is hedge and pending:
+                                self._hedge_won(kind, time.perf_counter() - started)
+                            self.observe(kind, time.perf_counter() - started)
+                            return winner.result()
+            result = await primary
+            self.observe(kind, time.perf_counter() - started)
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def astream(
+        self, call: Callable[[], AsyncIterator], kind: str = "stream"
+    ) -> AsyncIterator:
+        """Stream from `call()`, hedging on the time to the first item."""
+        started = time.perf_counter()
+        deadline = self.deadline(kind)
+        streams = {}  # first-item task -> stream
+        winner = None
+        try:
+            stream = call()
+            streams[asyncio.ensure_future(anext(stream))] = stream
+            if deadline is not None:
+                done, _ = await asyncio.wait(streams, timeout=deadline)
+                if not done and self._take_hedge():
+                    hedge = call()
+                    streams[asyncio.ensure_future(anext(hedge))] = hedge
+            pending = set(streams)
+            while winner is None:
+                done, pending = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+                task = next(iter(done))
+                if task.exception() is None or not pending:
+                    winner = task
+            if streams[winner] is not stream:
+                self._hedge_won(kind, time.perf_counter() - started)
+            self.observe(kind, time.perf_counter() - started)
+            try:
+                first = winner.result()
+            except StopAsyncIteration:
+                return
+            yield first
+            async for item in streams[winner]:
+                yield item
+        finally:
+            for task, other in streams.items():
+                if task is not winner:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    await other.aclose()
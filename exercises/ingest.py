@@ -0,0 +1,149 @@
+"""
+Parallel, streaming PDF ingestion.
+
+PDF pages are extracted in a process pool and streamed through the text splitter into
+fixed-size chunk batches, so only a bounded number of files is held in memory at any
+time while the consumer (e.g. the embedding model) is working on the previous batch.
+"""
+
+import json
+import os
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from langchain_core.documents import Document
+from langchain_text_splitters import TextSplitter
+
+
+def load_pdf_pages(file: str) -> list[Document]:
+    """Extract the pages of a PDF (one `Document` per page)."""
+    from langchain_community.document_loaders import PyMuPDFLoader
+
+    return PyMuPDFLoader(file).load()
+
+
+@dataclass
+class IngestStats:
+    files: int = 0
+    pages: int = 0
+    chunks: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    finished: float | None = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def report(self):
+        elapsed = max(self.elapsed, 1e-9)
+        print(
+            f"Ingested {self.files} files in {elapsed:.1f}s: "
+            f"{self.pages} pages ({self.pages / elapsed:.1f} pages/s), "
+            f"{self.chunks} chunks ({self.chunks / elapsed:.1f} chunks/s)"
+        )
+
+
+def splitter_settings(splitter: TextSplitter) -> dict:
+    """The settings of `splitter` that determine the chunks (class, size, overlap, ...)."""
+    settings = {name.lstrip("_"): value for name, value in vars(splitter).items()}
+    # functions (e.g. `length_function`) by name, not by their address
+    return json.loads(
+        json.dumps(
+            {"class": type(splitter).__name__, **settings},
+            sort_keys=True,
+            default=lambda value: getattr(value, "__qualname__", type(value).__name__),
+        )
+    )
+
+
+class _InlineExecutor:
+    """Stand-in for the process pool when running with a single worker."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, cancel_futures=False):
+        pass
+
+
+class PdfIngestor:
+    """
+    Streams PDFs through page extraction (in a process pool) and splitting.
+
+    Iterating `batches(files)` yields `(chunks, finished_files)` tuples: at most
+    `batch_size` chunks, plus the files whose last chunk has been yielded so far.
+    At most `max_pending` files are being extracted or buffered at any time.
+    """
+
+    def __init__(
+        self,
+        splitter: TextSplitter,
+        workers: int | None = None,
+        batch_size: int = 256,
+        max_pending: int | None = None,
+        load: Callable[[str], list[Document]] = load_pdf_pages,
+    ):
+        self.splitter = splitter
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_pending = max_pending or 2 * self.workers
+        self.load = load
+        self.stats = IngestStats()
+
+    def settings(self) -> dict:
+        """What the chunks depend on (see `PersistentVectorStore.sync`)."""
+        return {"splitter": splitter_settings(self.splitter), "loader": self.load.__qualname__}
+
+    def _pages(self, files: Iterable[str]) -> Iterator[tuple[str, list[Document]]]:
+        """Extract files in the pool, yielding results in input order."""
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(self.workers)
+        else:
+            executor = _InlineExecutor()
+        pending: deque[tuple[str, Future]] = deque()
+        try:
+            for file in files:
+                pending.append((file, executor.submit(self.load, file)))
+                if len(pending) >= self.max_pending:
+                    file, future = pending.popleft()
+                    yield file, future.result()
+            while pending:
+                file, future = pending.popleft()
+                yield file, future.result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def batches(self, files: Iterable[str]) -> Iterator[tuple[list[Document], list[str]]]:
+        self.stats = IngestStats()
+        buffer: list[Document] = []
+        # (file, number of chunks produced up to and including this file)
+        file_ends: deque[tuple[str, int]] = deque()
+        emitted = 0
+
+        def take(n):
+            nonlocal buffer, emitted
+            batch, buffer = buffer[:n], buffer[n:]
+            emitted += len(batch)
+            finished = []
+            while file_ends and file_ends[0][1] <= emitted:
+                finished.append(file_ends.popleft()[0])
+            self.stats.chunks += len(batch)
+            return batch, finished
+
+        for file, pages in self._pages(files):
+            chunks = self.splitter.split_documents(pages)
+            self.stats.files += 1
+            self.stats.pages += len(pages)
+            buffer.extend(chunks)
+            file_ends.append((file, emitted + len(buffer)))
+            while len(buffer) >= self.batch_size:
+                yield take(self.batch_size)
+
+        if buffer or file_ends:
+            yield take(len(buffer))
+        self.stats.finished = time.perf_counter()
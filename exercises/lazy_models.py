@@ -0,0 +1,458 @@
+"""
+Chat model and embeddings wrappers used by `llm_factory.py`.
+
+* `LazyChatModel` and `LazyEmbeddings` build the wrapped model on first use.
+* `ScheduledChatModel` runs every request through a `Scheduler` (rate limits,
+  priorities, retries).
+* `HedgedChatModel` sends a duplicate of slow requests (see `hedging.py`).
+* `RoutedChatModel` serves a role with a list of models, falling back on errors.
+
+Kept separate so that importing the factory doesn't import `langchain_core`.
+"""
+
+import json
+import threading
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import Any
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.messages.utils import get_buffer_string
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict, PrivateAttr
+
+from hedging import Hedger
+from scheduler import Scheduler
+
+
+class LazyChatModel(BaseChatModel):
+    """
+    A chat model that builds the real one (`inner`) on first use and delegates to it.
+
+    Binding tools doesn't build it either: `bind_tools` records the tools (in the
+    provider-neutral OpenAI format) and its arguments, and the first call binds them
+    with `inner.bind_tools`, so the provider-specific tool format is kept and calls
+    still pass through the wrapper. The model is identified (e.g. for the response cache
+    key) by its `preset` and constructor `params`.
+    """
+
+    preset: str = "default"
+    params: dict[str, Any] = {}
+    factory: Callable[[], BaseChatModel]
+    _inner: BaseChatModel | None = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _bound: dict[str, dict[str, Any]] = PrivateAttr(default_factory=dict)
+
+    @property
+    def inner(self) -> BaseChatModel:
+        if self._inner is None:
+            with self._lock:
+                if self._inner is None:
+                    self._inner = self.factory()
+        return self._inner
+
+    @property
+    def _llm_type(self) -> str:
+        return "lazy"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        # part of the response cache key: the wrapped model's name and parameters
+        return {"preset": self.preset, **self.params}
+
+    def bind_tools(self, tools, **kwargs):
+        # popped by the outermost model before the call, so it must stay a bound argument
+        extra = {}
+        if "ls_structured_output_format" in kwargs:
+            extra["ls_structured_output_format"] = kwargs.pop("ls_structured_output_format")
+        specs = [convert_to_openai_tool(tool) for tool in tools]
+        return self.bind(deferred_tools={"tools": specs, "kwargs": kwargs}, **extra)
+
+    def _resolve(self, kwargs: dict[str, Any]) -> dict[str, Any]:
+        """`kwargs` with the deferred tools bound by `inner` (once per set of tools)."""
+        deferred = kwargs.pop("deferred_tools", None)
+        if deferred is None:
+            return kwargs
+        key = json.dumps(deferred, sort_keys=True, default=repr)
+        with self._lock:
+            bound = self._bound.get(key)
+        if bound is None:
+            bound = self.inner.bind_tools(deferred["tools"], **deferred["kwargs"]).kwargs
+            with self._lock:
+                self._bound[key] = bound
+        return {**bound, **kwargs}
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        kwargs = self._resolve(kwargs)
+        return self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        kwargs = self._resolve(kwargs)
+        return await self.inner._agenerate(
+            messages, stop=stop, run_manager=run_manager, **kwargs
+        )
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        kwargs = self._resolve(kwargs)
+        yield from self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        kwargs = self._resolve(kwargs)
+        async for chunk in self.inner._astream(
+            messages, stop=stop, run_manager=run_manager, **kwargs
+        ):
+            yield chunk
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    Embeddings that build the real model on first use and delegate to it. `model_id`
+    identifies the model without building it (see `embedding_cache.embedding_id`).
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings], model_id: str = ""):
+        self.factory = factory
+        self.model_id = model_id
+        self._inner: Embeddings | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def inner(self) -> Embeddings:
+        if self._inner is None:
+            with self._lock:
+                if self._inner is None:
+                    self._inner = self.factory()
+        return self._inner
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.inner.embed_query(text)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        from embedding_cache import embed_queries
+
+        return embed_queries(self.inner, texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.inner.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self.inner.aembed_query(text)
+
+
+def estimate_tokens(messages: list[BaseMessage], **kwargs: Any) -> int:
+    """Rough prompt size in tokens (~4 characters per token), including bound tools."""
+    tools = kwargs.get("tools") or kwargs.get("deferred_tools") or ""
+    return (len(get_buffer_string(messages)) + len(str(tools))) // 4
+
+
+def used_tokens(result: ChatResult) -> int | None:
+    usage = (result.llm_output or {}).get("token_usage") or {}
+    if "total_tokens" in usage:
+        return usage["total_tokens"]
+    totals = [
+        g.message.usage_metadata["total_tokens"]
+        for g in result.generations
+        if getattr(g.message, "usage_metadata", None)
+    ]
+    return sum(totals) if totals else None
+
+
+class ScheduledChatModel(BaseChatModel):
+    """
+    Runs the requests of `inner` through `scheduler`.
+
+    `priority` overrides the priority of the surrounding `scheduler.priority(...)` block
+    (default: "normal").
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    inner: BaseChatModel
+    scheduler: Scheduler
+    priority: str | None = None
+
+    @property
+    def _llm_type(self) -> str:
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self.scheduler.run(
+            lambda: self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            tokens=estimate_tokens(messages, **kwargs),
+            priority=self.priority,
+            usage=used_tokens,
+        )
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await self.scheduler.arun(
+            lambda: self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            tokens=estimate_tokens(messages, **kwargs),
+            priority=self.priority,
+            usage=used_tokens,
+        )
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        yield from self.scheduler.stream(
+            lambda: self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs),
+            tokens=estimate_tokens(messages, **kwargs),
+            priority=self.priority,
+        )
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self.scheduler.astream(
+            lambda: self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs),
+            tokens=estimate_tokens(messages, **kwargs),
+            priority=self.priority,
+        ):
+            yield chunk
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    Hedges the requests of `inner` with `hedger`: invocations (sync and async) on the
+    time to the response, async streams on the time to the first chunk. Sync streams are
+    passed through.
+
+    The attempts get no run manager, so only the winner's chunks reach the callbacks
+    (through this model).
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    inner: BaseChatModel
+    hedger: Hedger
+
+    @property
+    def _llm_type(self) -> str:
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self.hedger.run(lambda: self.inner._generate(messages, stop=stop, **kwargs))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await self.hedger.arun(lambda: self.inner._agenerate(messages, stop=stop, **kwargs))
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        yield from self.inner._stream(messages, stop=stop, **kwargs)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self.hedger.astream(
+            lambda: self.inner._astream(messages, stop=stop, **kwargs)
+        ):
+            yield chunk
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    The model of a `role`: tries `models` in order and falls back to the next one when a
+    request fails (after the retries of the scheduler). Streams only fall back before
+    their first chunk.
+
+    Tools are bound in the format of the first model, so all models should come from
+    the same backend. The preset that answered is added to the `generation_info`
+    (`preset`), and `fallbacks` counts the fallbacks per failed preset.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    role: str
+    models: list[BaseChatModel]
+    fallbacks: dict[str, int] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return self.models[0]._llm_type
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {
+            **self.models[0]._identifying_params,
+            "role": self.role,
+            "presets": [preset_of(model) for model in self.models],
+        }
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(**self.models[0].bind_tools(tools, **kwargs).kwargs)
+
+    def stats(self) -> dict:
+        return {"fallbacks": sum(self.fallbacks.values())}
+
+    def _fall_back(self, model: BaseChatModel, attempt: int):
+        if attempt == len(self.models) - 1:
+            raise
+        preset = preset_of(model)
+        self.fallbacks[preset] = self.fallbacks.get(preset, 0) + 1
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        for attempt, model in enumerate(self.models):
+            try:
+                result = model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception:
+                self._fall_back(model, attempt)
+                continue
+            return tag_preset(result, preset_of(model))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        for attempt, model in enumerate(self.models):
+            try:
+                result = await model._agenerate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                )
+            except Exception:
+                self._fall_back(model, attempt)
+                continue
+            return tag_preset(result, preset_of(model))
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        for attempt, model in enumerate(self.models):
+            stream = model._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                first = next(stream, None)
+            except Exception:
+                self._fall_back(model, attempt)
+                continue
+            if first is not None:
+                yield tag_preset(first, preset_of(model))
+                yield from stream
+            return
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        for attempt, model in enumerate(self.models):
+            stream = model._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                first = await anext(stream, None)
+            except Exception:
+                self._fall_back(model, attempt)
+                continue
+            if first is not None:
+                yield tag_preset(first, preset_of(model))
+                async for chunk in stream:
+                    yield chunk
+            return
+
+
+def preset_of(model: BaseChatModel) -> str:
+    return model._identifying_params.get("preset", "default")
+
+
+def tag_preset(result: ChatResult | ChatGeneration, preset: str):
+    """Record in the generation info which preset produced `result`."""
+    for generation in getattr(result, "generations", [result]):
+        generation.generation_info = {**(generation.generation_info or {}), "preset": preset}
+    return result
@@ -1,23 +1,46 @@
+import functools
 import os
 
-model = None
-embeddings = None
-embedding_dimensions = 1536
+from llm_factory import (
+    BACKEND,
+    embedding_dimensions,
+    get_embeddings,
+    get_model,
+    get_role_model,  # noqa: F401
+    metrics,
+)
 
-if "DATABRICKS_RUNTIME_VERSION" in os.environ:
-    print("Running on Databricks.")
-    from databricks_langchain import ChatDatabricks, DatabricksEmbeddings
+# `model` and `embeddings` are created on first access (see `llm_factory.py`), so
+# importing this module doesn't import the provider packages or open connections.
+embedding_dimensions = embedding_dimensions()
 
-    model = ChatDatabricks(endpoint="databricks-claude-sonnet-4-5", temperature=0)
-    embeddings = DatabricksEmbeddings(endpoint="databricks-gte-large-en")
-    embedding_dimensions = 1024
+if BACKEND == "fake":
+    print("Running offline with the fake models.")
 else:
-    print("Running locally.")
-    import dotenv
-    from langchain_openai import AzureOpenAIEmbeddings
-    from langchain_openai.chat_models.azure import AzureChatOpenAI
-
-    dotenv.load_dotenv()
-    model = AzureChatOpenAI(deployment_name="gpt-4.1", temperature=0)
-    embeddings = AzureOpenAIEmbeddings(endpoint="text-embedding-003-large")
-    embedding_dimensions = 1536
+    print("Running on Databricks." if BACKEND == "databricks" else "Running locally.")
+
+
+@functools.cache
+def _embeddings():
+    from embedding_cache import CachedEmbeddings, embedding_id
+    from llm_metrics import InstrumentedEmbeddings
+
+    embeddings = get_embeddings()
+    if BACKEND != "fake":  # nothing to save by caching hashing embeddings
+        # Embeddings are cached on disk (keyed by the normalized text), so repeated chunks
+        # and memories are only embedded once. Set EMBEDDING_CACHE to change the location.
+        # The entries are keyed by backend, endpoint and size: other models never hit them.
+        embeddings = CachedEmbeddings(
+            embeddings,
+            path=os.environ.get("EMBEDDING_CACHE", ".cache/embeddings.sqlite"),
+            namespace=f"{embedding_id(embeddings)}-{embedding_dimensions}",
+        )
+    return InstrumentedEmbeddings(embeddings, metrics())
+
+
+def __getattr__(name: str):
+    if name == "model":
+        return get_model()
+    if name == "embeddings":
+        return _embeddings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,304 @@
+"""
+Lazy, pooled construction of the chat models and embeddings behind `llm.py`.
+
+Importing this module is cheap: `langchain_core` and the provider packages
+(`databricks_langchain`, `langchain_openai`) are only imported, and `.env` only loaded,
+when a model is first requested or used. Models are requested by name (see `MODELS`) and
+cached, and all Azure OpenAI clients talking to the same endpoint share one pooled
+`httpx` client, so extra models for sub-agents don't open new connections.
+
+All models share one `Scheduler` (see `scheduler.py`), configured with the environment
+variables `LLM_RPM`, `LLM_TPM` and `LLM_MAX_IN_FLIGHT` (default 16: further calls of the
+process wait for a slot, also those of async agents and servers), and report their calls
+to one `LLMMetrics` instance (see `llm_metrics.py`), which writes to `LLM_METRICS`
+(default: `.cache/llm_calls.jsonl`, `off` to keep the metrics in memory only).
+Requests can be hedged against slow responses (see `hedging.py`) with `hedge=True` or
+`LLM_HEDGE=1`. `get_role_model` serves a role (planner, judge, ...) with the presets
+configured in `ROLES`.
+
+    from llm_factory import get_model
+    model = get_model()                          # the default model
+    critic = get_model("default", temperature=0.7)
+    judge = get_role_model("judge")              # "fast", falling back to "default"
+"""
+
+import json
+import os
+import threading
+from typing import Any
+
+ON_DATABRICKS = "DATABRICKS_RUNTIME_VERSION" in os.environ
+# "databricks", "azure" or "fake" (offline models from `fake_llm.py`)
+BACKEND = os.environ.get("LLM_BACKEND") or ("databricks" if ON_DATABRICKS else "azure")
+BACKENDS = ("databricks", "azure", "fake")
+if BACKEND not in BACKENDS:
+    raise ValueError(f"Unknown LLM_BACKEND '{BACKEND}'. Choose one of {BACKENDS}.")
+
+# Named models: constructor arguments per backend. Add entries with `register_model`.
+MODELS: dict[str, dict[str, dict[str, Any]]] = {
+    "default": {
+        "databricks": {"endpoint": "databricks-claude-sonnet-4-5", "temperature": 0},
+        "azure": {"deployment_name": "gpt-4.1", "temperature": 0},
+        "fake": {},
+    },
+    # smaller and faster, for short classification, extraction and summarization calls
+    "fast": {
+        "databricks": {"endpoint": "databricks-gemma-3-12b", "temperature": 0},
+        "azure": {"deployment_name": "gpt-4.1-mini", "temperature": 0},
+        "fake": {},
+    },
+}
+EMBEDDINGS: dict[str, dict[str, dict[str, Any]]] = {
+    "default": {
+        "databricks": {"endpoint": "databricks-gte-large-en"},
+        "azure": {"endpoint": "text-embedding-003-large"},
+        "fake": {},
+    },
+}
+EMBEDDING_DIMENSIONS = {"databricks": 1024, "azure": 1536, "fake": 1024}
+
+# Model presets per role, in order of preference; the later ones are fallbacks. Override
+# with `LLM_ROLES`, e.g. `LLM_ROLES="judge=default;synthesizer=fast,default"`. Roles
+# without an entry use "default".
+ROLES: dict[str, list[str]] = {
+    "planner": ["default"],
+    "writer": ["default"],
+    "supervisor": ["default"],
+    "judge": ["fast", "default"],
+    "synthesizer": ["fast", "default"],
+}
+for _entry in filter(None, os.environ.get("LLM_ROLES", "").split(";")):
+    _role, _presets = _entry.split("=")
+    ROLES[_role.strip()] = [preset.strip() for preset in _presets.split(",")]
+
+# Artificial latency of the fake backend (seconds per call and per streamed chunk).
+FAKE_LATENCY = float(os.environ.get("LLM_FAKE_LATENCY", "0"))
+FAKE_CHUNK_LATENCY = float(os.environ.get("LLM_FAKE_CHUNK_LATENCY", "0"))
+
+# Connection pool of the shared HTTP clients (per endpoint).
+MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "64"))
+TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "120"))
+
+_lock = threading.RLock()
+_models: dict[tuple, Any] = {}
+_embeddings: dict[str, Any] = {}
+_http_clients: dict[tuple[str, bool], Any] = {}
+_response_caches: dict[str, Any] = {}
+_hedgers: dict[str, Any] = {}
+_scheduler = None
+_metrics = None
+_dotenv_loaded = False
+
+
+def register_model(name: str, **backends: dict[str, Any]):
+    """Register a named model, e.g. `register_model("fast", azure={...}, databricks={...})`."""
+    MODELS[name] = backends
+
+
+def embedding_dimensions(name: str = "default") -> int:
+    return EMBEDDING_DIMENSIONS[BACKEND]
+
+
+def _load_dotenv():
+    global _dotenv_loaded
+    if not _dotenv_loaded and BACKEND == "azure":
+        import dotenv
+
+        dotenv.load_dotenv()
+        _dotenv_loaded = True
+
+
+def http_client(endpoint: str | None, asynchronous: bool = False):
+    """The pooled `httpx` client shared by all clients of `endpoint`."""
+    import httpx
+
+    with _lock:
+        key = (endpoint or "", asynchronous)
+        if key not in _http_clients:
+            limits = httpx.Limits(
+                max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS
+            )
+            client_cls = httpx.AsyncClient if asynchronous else httpx.Client
+            _http_clients[key] = client_cls(limits=limits, timeout=TIMEOUT)
+        return _http_clients[key]
+
+
+def _azure_clients(params: dict[str, Any]) -> dict[str, Any]:
+    endpoint = params.get("azure_endpoint") or os.environ.get("AZURE_OPENAI_ENDPOINT")
+    return {
+        "http_client": http_client(endpoint),
+        "http_async_client": http_client(endpoint, asynchronous=True),
+    }
+
+
+def _build_model(params: dict[str, Any]):
+    if BACKEND == "fake":
+        from fake_llm import FakeChatModel
+
+        return FakeChatModel(
+            **{"latency": FAKE_LATENCY, "chunk_latency": FAKE_CHUNK_LATENCY, **params}
+        )
+    if BACKEND == "databricks":
+        from databricks_langchain import ChatDatabricks
+
+        return ChatDatabricks(**params)
+    _load_dotenv()
+    from langchain_openai.chat_models.azure import AzureChatOpenAI
+
+    return AzureChatOpenAI(**_azure_clients(params), **params)
+
+
+def _build_embeddings(params: dict[str, Any]):
+    if BACKEND == "fake":
+        from fake_llm import HashingEmbeddings
+
+        return HashingEmbeddings(EMBEDDING_DIMENSIONS["fake"], **params)
+    if BACKEND == "databricks":
+        from databricks_langchain import DatabricksEmbeddings
+
+        return DatabricksEmbeddings(**params)
+    _load_dotenv()
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    return AzureOpenAIEmbeddings(**_azure_clients(params), **params)
+
+
+def response_cache(path: str):
+    """The `ResponseCache` stored at `path` (one instance per file)."""
+    from response_cache import ResponseCache
+
+    with _lock:
+        if path not in _response_caches:
+            _response_caches[path] = ResponseCache(path)
+        return _response_caches[path]
+
+
+def scheduler():
+    """The scheduler shared by all models of this process."""
+    global _scheduler
+    from scheduler import Scheduler
+
+    with _lock:
+        if _scheduler is None:
+            rpm, tpm = os.environ.get("LLM_RPM"), os.environ.get("LLM_TPM")
+            _scheduler = Scheduler(
+                rpm=float(rpm) if rpm else None,
+                tpm=float(tpm) if tpm else None,
+                max_in_flight=int(os.environ.get("LLM_MAX_IN_FLIGHT", "16")),
+            )
+        return _scheduler
+
+
+def metrics():
+    """The call metrics shared by all models of this process."""
+    global _metrics
+    from llm_metrics import LLMMetrics
+
+    with _lock:
+        if _metrics is None:
+            path = os.environ.get("LLM_METRICS", ".cache/llm_calls.jsonl")
+            _metrics = LLMMetrics(path if path not in ("", "0", "off") else None)
+            _metrics.gauges["llm_scheduler"] = scheduler().stats
+        return _metrics
+
+
+def _serving_model(name: str, hedge: bool, overrides: dict[str, Any]):
+    """The model `name` as called by the outermost wrapper: lazy, scheduled, maybe hedged."""
+    from hedging import Hedger
+    from lazy_models import HedgedChatModel, LazyChatModel, ScheduledChatModel
+
+    if name not in MODELS:
+        raise KeyError(f"Unknown model '{name}'. Choose one of {sorted(MODELS)}.")
+    params = {**MODELS[name].get(BACKEND, {}), **overrides}
+    model = ScheduledChatModel(
+        inner=LazyChatModel(
+            preset=name,
+            params={"backend": BACKEND, **params},
+            factory=lambda: _build_model(params),
+        ),
+        scheduler=scheduler(),
+    )
+    if hedge:
+        # outside the scheduler, so that each duplicate is scheduled like any request
+        if name not in _hedgers:
+            _hedgers[name] = Hedger()
+            metrics().gauges[f"llm_hedging_{name}"] = _hedgers[name].stats
+        model = HedgedChatModel(inner=model, hedger=_hedgers[name])
+    return model
+
+
+def _outermost(model, cache: str | None):
+    # the outermost model checks the cache (before anything is scheduled) and reports
+    # to the metrics
+    model.cache = response_cache(cache) if cache else None
+    model.callbacks = [metrics()]
+    return model
+
+
+def _hedge_default(hedge: bool | None) -> bool:
+    if hedge is None:
+        return os.environ.get("LLM_HEDGE", "") not in ("", "0", "off")
+    return hedge
+
+
+def get_model(
+    name: str = "default", cache: str | None = None, hedge: bool | None = None, **overrides
+):
+    """
+    The chat model `name` (with constructor `overrides`), built on first use.
+
+    The provider model is wrapped in a `LazyChatModel`, so callers can bind tools (which
+    are converted to the provider's format on the first call) or compose it into chains
+    at import time without paying for the provider import. Calls
+    go through the shared `scheduler()`, and responses are cached on disk (see
+    `response_cache.py`) if `cache` or the `LLM_CACHE` environment variable is set to a
+    file path. With `hedge` (default: `LLM_HEDGE`), slow requests are hedged.
+    """
+    cache = cache or os.environ.get("LLM_CACHE")
+    hedge = _hedge_default(hedge)
+    key = (name, cache, hedge, tuple(sorted(overrides.items())))
+    with _lock:
+        if key not in _models:
+            _models[key] = _outermost(_serving_model(name, hedge, overrides), cache)
+        return _models[key]
+
+
+def get_role_model(role: str, cache: str | None = None, hedge: bool | None = None):
+    """
+    The model for `role` (see `ROLES`): its presets in order, falling back to the next
+    one on errors. The calls are reported with the role as caller, so the metrics show
+    latency, tokens and errors per role and preset; report quality scores with
+    `metrics().record_score(role, score)`, which credits the preset that answered last.
+    """
+    from lazy_models import RoutedChatModel
+
+    cache = cache or os.environ.get("LLM_CACHE")
+    hedge = _hedge_default(hedge)
+    key = (f"role:{role}", cache, hedge)
+    with _lock:
+        if key not in _models:
+            router = RoutedChatModel(
+                role=role,
+                models=[_serving_model(name, hedge, {}) for name in ROLES.get(role, ["default"])],
+                metadata={"caller": role},
+            )
+            metrics().gauges[f"llm_role_{role}"] = router.stats
+            _models[key] = _outermost(router, cache)
+        return _models[key]
+
+
+def get_embeddings(name: str = "default"):
+    """The embeddings model `name`, built on first use (see `LazyEmbeddings`)."""
+    from lazy_models import LazyEmbeddings
+
+    if name not in EMBEDDINGS:
+        raise KeyError(f"Unknown embeddings '{name}'. Choose one of {sorted(EMBEDDINGS)}.")
+    with _lock:
+        if name not in _embeddings:
+            params = EMBEDDINGS[name].get(BACKEND, {})
+            _embeddings[name] = LazyEmbeddings(
+                lambda: _build_embeddings(params),
+                model_id=f"{BACKEND}:{name}:{json.dumps(params, sort_keys=True)}",
+            )
+        return _embeddings[name]
+
@@ -0,0 +1,336 @@
+"""
+Latency and token accounting for model calls.
+
+`LLMMetrics` is a LangChain callback handler; `llm_factory.py` installs one instance on
+every chat model it creates, and `InstrumentedEmbeddings` reports embedding calls to it.
+For each call it records
+
+* `kind` (`chat` or `embedding`), `model` (the factory preset) and `caller`: the
+  `caller` entry of the run's metadata (`model.with_config(metadata={"caller": "judge"})`),
+  else the LangGraph node, else the first plain tag,
+* latency, time to first token (streaming calls),
+* prompt and completion tokens (as reported by the provider), and
+* whether the response came from the response cache, or the error.
+
+Quality scores (e.g. from an LLM judge) are reported per caller with `record_score`, so
+that latency and quality of a role can be compared across model presets. A score is
+attributed to the preset that answered the caller's latest call, unless `model` is given.
+
+The hot path only updates in-memory aggregates and appends the record to a queue; a
+background thread writes the records to a rolling JSONL file (`path`, rotated at
+`max_bytes` with `backups` old files) together with a Prometheus text snapshot of the
+aggregates (`<path>.prom`, see `prometheus()`).
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables.config import ensure_config
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def caller_of(tags: list[str] | None, metadata: dict | None) -> str:
+    metadata = metadata or {}
+    if metadata.get("caller"):
+        return str(metadata["caller"])
+    if metadata.get("langgraph_node"):
+        return str(metadata["langgraph_node"])
+    plain = [tag for tag in tags or [] if ":" not in tag]
+    return plain[0] if plain else "default"
+
+
+def usage_of(response: LLMResult) -> tuple[int | None, int | None]:
+    prompt = completion = None
+    for generation in (g for gens in response.generations for g in gens):
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            prompt = (prompt or 0) + usage.get("input_tokens", 0)
+            completion = (completion or 0) + usage.get("output_tokens", 0)
+    if prompt is None:
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt = token_usage.get("prompt_tokens")
+        completion = token_usage.get("completion_tokens")
+    return prompt, completion
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+class _Series:
+    def __init__(self):
+        self.calls = self.errors = self.prompt_tokens = self.completion_tokens = 0
+        self.latency = self.ttft = 0.0
+        self.ttft_count = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+
+class LLMMetrics(BaseCallbackHandler):
+    run_inline = True  # cheap enough to run in the caller, also in async code
+
+    def __init__(
+        self,
+        path: str | None = ".cache/llm_calls.jsonl",
+        max_bytes: int = 16 * 2**20,
+        backups: int = 3,
+        flush_interval: float = 1.0,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.gauges: dict[str, Callable[[], dict[str, float]]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._runs: dict[UUID, list] = {}  # run id -> [started, caller, model, ttft]
+        self._series: dict[tuple[str, str, str, str], _Series] = defaultdict(_Series)
+        self._scores: dict[tuple[str, str], list[float]] = defaultdict(lambda: [0.0, 0])
+        self._answered_by: dict[str, str] = {}  # caller -> preset of its latest chat call
+        self._records: queue.SimpleQueue = queue.SimpleQueue()
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            threading.Thread(target=self._writer, daemon=True, name="llm-metrics").start()
+            atexit.register(self.flush)
+
+    # recording
+
+    def record(
+        self,
+        kind: str,
+        caller: str,
+        model: str,
+        latency: float,
+        prompt_tokens: int | None = None,
+        completion_tokens: int | None = None,
+        ttft: float | None = None,
+        cached: bool = False,
+        error: str | None = None,
+    ):
+        with self._lock:
+            series = self._series[kind, caller, model, "hit" if cached else "miss"]
+            series.calls += 1
+            series.errors += error is not None
+            series.prompt_tokens += prompt_tokens or 0
+            series.completion_tokens += completion_tokens or 0
+            series.latency += latency
+            if kind == "chat" and error is None:
+                self._answered_by[caller] = model
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    series.buckets[i] += 1
+                    break
+            if ttft is not None:
+                series.ttft += ttft
+                series.ttft_count += 1
+        if self.path:
+            self._records.put(
+                {
+                    "ts": time.time(),
+                    "kind": kind,
+                    "caller": caller,
+                    "model": model,
+                    "latency_ms": round(1000 * latency, 2),
+                    "ttft_ms": round(1000 * ttft, 2) if ttft is not None else None,
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "cached": cached,
+                    "error": error,
+                }
+            )
+
+    def record_score(self, caller: str, score: float, model: str | None = None):
+        """
+        Report a quality score of the output of `caller` (e.g. a judge's 1-10 score). By
+        default the score goes to the preset that answered the latest call of `caller`.
+        """
+        with self._lock:
+            model = model or self._answered_by.get(caller, "default")
+            totals = self._scores[caller, model]
+            totals[0] += score
+            totals[1] += 1
+        if self.path:
+            record = {"ts": time.time(), "kind": "score", "caller": caller, "model": model}
+            self._records.put({**record, "score": score})
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list,
+        *,
+        run_id: UUID,
+        tags: list[str] | None = None,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ):
+        model = (kwargs.get("invocation_params") or {}).get("preset", "default")
+        self._runs[run_id] = [time.perf_counter(), caller_of(tags, metadata), model, None]
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        run = self._runs.get(run_id)
+        if run is not None and run[3] is None:
+            run[3] = time.perf_counter() - run[0]
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        started, caller, model, ttft = run
+        infos = [g.generation_info or {} for gens in response.generations for g in gens]
+        cached = any(info.get("cached") for info in infos)
+        # a routed model reports the preset that answered
+        model = next((info["preset"] for info in infos if info.get("preset")), model)
+        prompt, completion = usage_of(response)
+        latency = time.perf_counter() - started
+        self.record("chat", caller, model, latency, prompt, completion, ttft, cached)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            started, caller, model, ttft = run
+            self.record(
+                "chat",
+                caller,
+                model,
+                time.perf_counter() - started,
+                ttft=ttft,
+                error=f"{type(error).__name__}: {error}"[:500],
+            )
+
+    # export
+
+    def prometheus(self) -> str:
+        """The aggregates in the Prometheus text exposition format."""
+        with self._lock:
+            series = list(self._series.items())
+            scores = list(self._scores.items())
+            lines = []
+            for name, kind, help_text in (
+                ("llm_calls_total", "counter", "Model calls."),
+                ("llm_errors_total", "counter", "Failed model calls."),
+                ("llm_tokens_total", "counter", "Prompt and completion tokens."),
+                ("llm_latency_seconds", "histogram", "Model call latency."),
+                ("llm_time_to_first_token_seconds", "summary", "Time to first streamed token."),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for (kind_, caller, model, cache), s in series:
+                    labels = _labels(kind=kind_, caller=caller, model=model, cache=cache)
+                    if name == "llm_calls_total":
+                        lines.append(f"{name}{{{labels}}} {s.calls}")
+                    elif name == "llm_errors_total":
+                        lines.append(f"{name}{{{labels}}} {s.errors}")
+                    elif name == "llm_tokens_total":
+                        lines.append(f'{name}{{{labels},type="prompt"}} {s.prompt_tokens}')
+                        lines.append(f'{name}{{{labels},type="completion"}} {s.completion_tokens}')
+                    elif name == "llm_latency_seconds":
+                        total = 0
+                        for bound, count in zip(LATENCY_BUCKETS, s.buckets):
+                            total += count
+                            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+                        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {s.calls}')
+                        lines.append(f"{name}_sum{{{labels}}} {s.latency:.6f}")
+                        lines.append(f"{name}_count{{{labels}}} {s.calls}")
+                    elif s.ttft_count:
+                        lines.append(f"{name}_sum{{{labels}}} {s.ttft:.6f}")
+                        lines.append(f"{name}_count{{{labels}}} {s.ttft_count}")
+            name = "llm_quality_score"
+            lines += [f"# HELP {name} Reported quality scores.", f"# TYPE {name} summary"]
+            for (caller, model), (total, count) in scores:
+                labels = _labels(caller=caller, model=model)
+                lines.append(f"{name}_sum{{{labels}}} {total}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+        for prefix, gauges in self.gauges.items():
+            for key, value in gauges().items():
+                lines += [f"# TYPE {prefix}_{key} gauge", f"{prefix}_{key} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def _rotate(self):
+        for i in range(self.backups, 0, -1):
+            source = f"{self.path}.{i - 1}" if i > 1 else self.path
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i}")
+
+    def flush(self):
+        """Write the queued records and the Prometheus snapshot."""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        records = []
+        while True:
+            try:
+                records.append(self._records.get_nowait())
+            except queue.Empty:
+                break
+        if records:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "a") as f:
+                f.writelines(json.dumps(record) + "\n" for record in records)
+        with open(f"{self.path}.prom.tmp", "w") as f:
+            f.write(self.prometheus())
+        os.replace(f"{self.path}.prom.tmp", f"{self.path}.prom")
+
+    def _writer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if not self._records.empty():
+                self.flush()
+
+
+class InstrumentedEmbeddings(Embeddings):
+    """
+    Reports the calls to `embeddings` to `metrics` (tokens are estimated). The caller is
+    resolved like for chat calls, from the config of the runnable or graph node making the
+    call (`caller` metadata, node name, tags).
+    """
+
+    def __init__(self, embeddings: Embeddings, metrics: LLMMetrics, model: str = "default"):
+        self.embeddings = embeddings
+        self.metrics = metrics
+        self.model = model
+
+    def _record(self, texts: list[str], started: float):
+        # `CachedEmbeddings` reports the cache hits of this thread's last call
+        hits = getattr(self.embeddings, "last_call_hits", 0)
+        config = ensure_config()  # of the enclosing runnable, if any
+        self.metrics.record(
+            "embedding",
+            caller_of(config.get("tags"), config.get("metadata")),
+            self.model,
+            time.perf_counter() - started,
+            prompt_tokens=sum(len(text) for text in texts) // 4,
+            cached=bool(texts) and hits == len(texts),
+        )
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        started = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        self._record(texts, started)
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        started = time.perf_counter()
+        vector = self.embeddings.embed_query(text)
+        self._record([text], started)
+        return vector
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        from embedding_cache import embed_queries
+
+        started = time.perf_counter()
+        vectors = embed_queries(self.embeddings, texts)
+        self._record(texts, started)
+        return vectors
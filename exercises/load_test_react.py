@@ -0,0 +1,153 @@
+"""
+Load test: throughput of the ReAct agent of `src/04_react.py` with the synchronous
+graph (`build_agent`, one thread per conversation) versus the async builders
+(`build_agent_async` and `build_agent_func_async`, all conversations on one event loop),
+all from `react_async.py`.
+
+Every conversation asks the offline model (`LLM_BACKEND=fake`, `--latency` seconds per
+call) a question, runs the requested tool call (`--tool-latency` seconds; a blocking
+function for the sync graph, a coroutine for the async one) and gets the final answer:
+two model calls and one tool call. The sync graph runs `--threads` conversations at a
+time, the async agents up to `--concurrency` (default: all of them).
+
+Usage (from the `exercises/` folder):
+
+    python load_test_react.py --conversations 500 --latency 0.5
+    python load_test_react.py --mode async-func --conversations 2000 --concurrency 1000
+"""
+
+import argparse
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import BaseTool, tool
+
+from react_async import build_agent, build_agent_async, build_agent_func_async
+
+
+MODES = ["sync", "async", "async-func"]
+
+
+def lookup_tools(latency: float) -> tuple[BaseTool, BaseTool]:
+    """The same `lookup` tool as a blocking function and as a coroutine."""
+
+    @tool
+    def lookup(key: str) -> str:
+        """Look up the record stored under `key`."""
+        time.sleep(latency)
+        return f"Record {key}"
+
+    @tool("lookup")
+    async def alookup(key: str) -> str:
+        """Look up the record stored under `key`."""
+        await asyncio.sleep(latency)
+        return f"Record {key}"
+
+    return lookup, alookup
+
+
+def question(i: int) -> list[HumanMessage]:
+    return [HumanMessage(f"Use lookup to find the record of customer {i}.")]
+
+
+def percentile(values, q):
+    return sorted(values)[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def summarize(mode: str, latencies: list[float], elapsed: float, llm_calls: int, threads: int):
+    return {
+        "mode": mode,
+        "conversations": len(latencies),
+        "elapsed_s": elapsed,
+        "conversations_per_s": len(latencies) / elapsed,
+        "latency_p50_ms": 1000 * percentile(latencies, 50),
+        "latency_p95_ms": 1000 * percentile(latencies, 95),
+        "llm_calls": llm_calls,
+        "peak_threads": threads,
+    }
+
+
+def load_test_sync(agent, conversations: int, threads: int) -> dict:
+    latencies, llm_calls, peak = [], [], threading.active_count()
+
+    def conversation(i: int):
+        nonlocal peak
+        started = time.perf_counter()
+        state = agent.invoke({"messages": question(i)})
+        latencies.append(time.perf_counter() - started)
+        llm_calls.append(state["llm_calls"])
+        peak = max(peak, threading.active_count())
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(conversation, range(conversations)))
+    return summarize("sync", latencies, time.perf_counter() - started, sum(llm_calls), peak)
+
+
+async def load_test_async(mode: str, agent, conversations: int, concurrency: int) -> dict:
+    """`agent` from `build_agent_async` ("async") or `build_agent_func_async` ("async-func")."""
+    latencies, llm_calls, peak = [], [], threading.active_count()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def conversation(i: int):
+        nonlocal peak
+        async with semaphore:
+            started = time.perf_counter()
+            if mode == "async":
+                state = await agent.ainvoke({"messages": question(i)})
+                llm_calls.append(state["llm_calls"])
+            else:  # the functional agent returns the messages
+                messages = await agent.ainvoke(question(i))
+                llm_calls.append(sum(message.type == "ai" for message in messages))
+            latencies.append(time.perf_counter() - started)
+        peak = max(peak, threading.active_count())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(i) for i in range(conversations)))
+    return summarize(mode, latencies, time.perf_counter() - started, sum(llm_calls), peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=["all", *MODES], default="all")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16, help="sync: conversations at a time")
+    parser.add_argument("--concurrency", type=int, help="async: conversations at a time")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per model call")
+    parser.add_argument("--tool-latency", type=float, default=0.1, help="seconds per tool call")
+    args = parser.parse_args()
+    concurrency = args.concurrency or args.conversations
+
+    # the offline model, and no in-flight cap below the number of conversations
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["LLM_FAKE_LATENCY"] = str(args.latency)
+    os.environ.setdefault("LLM_MAX_IN_FLIGHT", str(max(concurrency, args.threads, 16)))
+    os.environ.setdefault("LLM_METRICS", "off")
+    from llm import model
+
+    lookup, alookup = lookup_tools(args.tool_latency)
+    results = []
+    for mode in MODES if args.mode == "all" else [args.mode]:
+        if mode == "sync":
+            agent = build_agent(model, [lookup])
+            results.append(load_test_sync(agent, args.conversations, args.threads))
+            continue
+        builder = build_agent_async if mode == "async" else build_agent_func_async
+        agent = builder(model, [alookup])
+        test = load_test_async(mode, agent, args.conversations, concurrency)
+        results.append(asyncio.run(test))
+
+    ideal = 2 * args.latency + args.tool_latency
+    print(f"ideal latency per conversation: {1000 * ideal:.0f}ms")
+    for result in results:
+        print()
+        for key, value in result.items():
+            print(f"{key:>20}: {value:.3f}" if isinstance(value, float) else f"{key:>20}: {value}")
+
+
+if __name__ == "__main__":
+    main()
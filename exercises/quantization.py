@@ -0,0 +1,63 @@
+"""
+Compact in-memory copies of the embedding matrix.
+
+* `float16`: half precision, 2 bytes per dimension.
+* `int8`: symmetric per-vector quantization, 1 byte per dimension plus one float32
+  scale per vector (`x ≈ codes * scale`).
+
+`QuantizedMatrix` behaves like a read-only float32 matrix for the search backends in
+`ann.py`: indexing it returns de-quantized float32 rows, so backends work unchanged.
+"""
+
+import numpy as np
+
+STORAGE_TYPES = ("float32", "float16", "int8")
+BLOCK = 8192
+
+
+class QuantizedMatrix:
+    def __init__(self, codes: np.ndarray, scales: np.ndarray | None = None):
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def quantize(cls, matrix: np.ndarray, storage: str = "int8") -> "QuantizedMatrix":
+        """Quantize `matrix` block by block (it may be memory-mapped)."""
+        if storage == "float16":
+            codes = np.empty(matrix.shape, dtype=np.float16)
+            for i in range(0, len(matrix), BLOCK):
+                codes[i : i + BLOCK] = matrix[i : i + BLOCK]
+            return cls(codes)
+        if storage != "int8":
+            raise ValueError(f"Unknown storage '{storage}'. Choose one of {STORAGE_TYPES}.")
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        scales = np.empty(len(matrix), dtype=np.float32)
+        for i in range(0, len(matrix), BLOCK):
+            block = np.asarray(matrix[i : i + BLOCK], dtype=np.float32)
+            scale = np.abs(block).max(axis=1) / 127
+            scale[scale == 0] = 1.0
+            codes[i : i + BLOCK] = np.round(block / scale[:, None])
+            scales[i : i + BLOCK] = scale
+        return cls(codes, scales)
+
+    def state(self) -> dict:
+        if self.scales is None:
+            return {"codes": self.codes}
+        return {"codes": self.codes, "scales": self.scales}
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index) -> np.ndarray:
+        rows = self.codes[index].astype(np.float32)
+        if self.scales is not None:
+            rows *= self.scales[index][..., None]
+        return rows
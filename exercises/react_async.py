@@ -0,0 +1,177 @@
+"""
+Builders for the ReAct agent of `src/04_react.py`, shared by the exercise, the
+benchmark (`bench_react.py`) and the load test (`load_test_react.py`).
+
+* `build_agent`: the `StateGraph` of the exercise; it blocks a thread per conversation
+  while it waits for the model, and runs the tool calls of a step on threads with
+  `run_tool_calls` (see `tool_execution.py`).
+
+`build_agent_func` in the exercise blocks a thread per conversation, too. The async
+builders `await` the model (`ainvoke`) and the tools (which may be coroutines), so the
+compiled graphs support `ainvoke` and `astream`, and a single event loop can interleave
+hundreds of agent runs (see `load_test_react.py`).
+
+* `build_agent_async`: the `StateGraph` version; the tool calls of a step run
+  concurrently with `arun_tool_calls`.
+* `build_agent_func_async`: the functional API version (`@entrypoint`, `@task`).
+
+Notebooks already run an event loop, and `asyncio.run` can't be nested; `run_async`
+runs a coroutine on a loop of its own, in a background thread. That loop lives as long as
+the process, as do the async HTTP clients of the models, which are bound to it.
+
+    agent = build_agent_async(model, [add, multiply])
+    state = run_async(agent.ainvoke({"messages": [HumanMessage("Calculate 3 * (4 + 5)")]}))
+"""
+
+import asyncio
+import operator
+import threading
+from collections.abc import Callable, Coroutine
+from typing import Any, Literal
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AnyMessage,
+    BaseMessage,
+    SystemMessage,
+    ToolCall,
+    ToolMessage,
+)
+from langchain_core.tools import BaseTool
+from langgraph.func import entrypoint, task
+from langgraph.graph import END, START, StateGraph, add_messages
+from typing_extensions import Annotated, TypedDict
+
+from tool_execution import arun_tool_calls, call_tool, run_tool_calls
+
+SYSTEM_PROMPT = "You are a helpful assistant tasked with performing arithmetic on a set of inputs."
+
+
+class MessagesState(TypedDict):
+    messages: Annotated[list[AnyMessage], operator.add]
+    llm_calls: int
+
+
+def build_agent(
+    model: BaseChatModel,
+    tools: list[BaseTool],
+    system_prompt: str = SYSTEM_PROMPT,
+    call: Callable[[BaseTool, ToolCall], ToolMessage] = call_tool,
+    max_concurrency: int = 8,
+    timeout: float | None = 60.0,
+):
+    """The ReAct graph; `call` runs one tool call (see `run_tool_calls`)."""
+    tools_by_name = {tool.name: tool for tool in tools}
+    model_with_tools = model.bind_tools(tools)
+    system = SystemMessage(content=system_prompt)
+
+    def llm_call(state: dict):
+        """LLM decides whether to call a tool or not"""
+        response = model_with_tools.invoke([system] + state["messages"])
+        return {"messages": [response], "llm_calls": state.get("llm_calls", 0) + 1}
+
+    def tool_node(state: dict):
+        """Performs the tool calls, concurrently on threads"""
+        # the messages keep the order of the tool calls
+        tool_calls = state["messages"][-1].tool_calls
+        messages = run_tool_calls(
+            tool_calls, tools_by_name, max_concurrency=max_concurrency, timeout=timeout, call=call
+        )
+        return {"messages": messages}
+
+    def should_continue(state: MessagesState) -> Literal["tool_node", END]:
+        """Decide if we should continue the loop or stop"""
+        return "tool_node" if state["messages"][-1].tool_calls else END
+
+    agent_builder = StateGraph(MessagesState)
+    agent_builder.add_node("llm_call", llm_call)
+    agent_builder.add_node("tool_node", tool_node)
+    agent_builder.add_edge(START, "llm_call")
+    agent_builder.add_conditional_edges("llm_call", should_continue, ["tool_node", END])
+    agent_builder.add_edge("tool_node", "llm_call")
+    return agent_builder.compile()
+
+
+def build_agent_async(
+    model: BaseChatModel,
+    tools: list[BaseTool],
+    system_prompt: str = SYSTEM_PROMPT,
+    max_concurrency: int = 8,
+    timeout: float | None = 60.0,
+):
+    """The ReAct graph with async nodes; tool calls as in `arun_tool_calls`."""
+    tools_by_name = {tool.name: tool for tool in tools}
+    model_with_tools = model.bind_tools(tools)
+    system = SystemMessage(content=system_prompt)
+
+    async def llm_call(state: dict):
+        """LLM decides whether to call a tool or not"""
+        response = await model_with_tools.ainvoke([system] + state["messages"])
+        return {"messages": [response], "llm_calls": state.get("llm_calls", 0) + 1}
+
+    async def tool_node(state: dict):
+        """Performs the tool calls, concurrently on the event loop"""
+        tool_calls = state["messages"][-1].tool_calls
+        messages = await arun_tool_calls(
+            tool_calls, tools_by_name, max_concurrency=max_concurrency, timeout=timeout
+        )
+        return {"messages": messages}
+
+    def should_continue(state: MessagesState) -> Literal["tool_node", END]:
+        """Decide if we should continue the loop or stop"""
+        return "tool_node" if state["messages"][-1].tool_calls else END
+
+    agent_builder = StateGraph(MessagesState)
+    agent_builder.add_node("llm_call", llm_call)
+    agent_builder.add_node("tool_node", tool_node)
+    agent_builder.add_edge(START, "llm_call")
+    agent_builder.add_conditional_edges("llm_call", should_continue, ["tool_node", END])
+    agent_builder.add_edge("tool_node", "llm_call")
+    return agent_builder.compile()
+
+
+def build_agent_func_async(
+    model: BaseChatModel, tools: list[BaseTool], system_prompt: str = SYSTEM_PROMPT
+):
+    """The ReAct agent with the functional API; takes and returns the message list."""
+    tools_by_name = {tool.name: tool for tool in tools}
+    model_with_tools = model.bind_tools(tools)
+    system = SystemMessage(content=system_prompt)
+
+    @task
+    async def call_llm(messages: list[BaseMessage]):
+        """LLM decides whether to call a tool or not"""
+        return await model_with_tools.ainvoke([system] + messages)
+
+    @task
+    async def call_tool(tool_call: ToolCall):
+        """Performs the tool call (sync tools run on a thread)"""
+        return await tools_by_name[tool_call["name"]].ainvoke(tool_call)
+
+    @entrypoint()
+    async def agent(messages: list[BaseMessage]):
+        model_response = await call_llm(messages)
+        while model_response.tool_calls:
+            # the tool calls of a step run concurrently
+            tool_results = await asyncio.gather(
+                *(call_tool(tool_call) for tool_call in model_response.tool_calls)
+            )
+            messages = add_messages(messages, [model_response, *tool_results])
+            model_response = await call_llm(messages)
+        return add_messages(messages, model_response)
+
+    return agent
+
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def run_async(coroutine: Coroutine) -> Any:
+    """Run `coroutine` on the background event loop and wait for its result."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="react-async", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coroutine, _loop).result()
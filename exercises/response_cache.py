@@ -0,0 +1,142 @@
+"""
+A persistent cache for chat model responses.
+
+With `temperature=0`, evaluation and regression runs send byte-identical prompts again
+and again. `ResponseCache` is a LangChain cache: set it as a chat model's `cache` and
+LangChain keys each lookup on the serialized messages and on the model's "LLM string"
+(its type, name and parameters plus the call's bound arguments: tools, tool choice and
+structured output format), so `invoke`, `bind_tools` and `with_structured_output` calls
+are all cached. Streaming calls are not.
+
+Entries are stored in SQLite. Entries older than `max_age` seconds are ignored and
+removed, and when the cache grows beyond `max_bytes` the least recently used entries are
+evicted.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from collections.abc import Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+class ResponseCache(BaseCache):
+    def __init__(
+        self,
+        path: str = ".cache/responses.sqlite",
+        max_bytes: int = 256 * 2**20,
+        max_age: float | None = 7 * 24 * 3600,
+    ):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        with self._lock:
+            self._expire()
+            self._size = self.db.execute(
+                "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM responses"
+            ).fetchone()[0]
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode()).hexdigest()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "entries": self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0],
+            "bytes": self._size,
+        }
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        key = self.key(prompt, llm_string)
+        with self._lock:
+            row = self.db.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or (self.max_age is not None and row[1] < now - self.max_age):
+                self.misses += 1
+                return None
+            with self.db:
+                self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # `loads` is marked as beta
+            generations = loads(row[0], allowed_objects="core")
+        for generation in generations:  # lets callbacks tell cache hits apart
+            generation.generation_info = {**(generation.generation_info or {}), "cached": True}
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence):
+        key = self.key(prompt, llm_string)
+        value = dumps(list(return_val))
+        now = time.time()
+        with self._lock:
+            old = self.db.execute(
+                "SELECT LENGTH(value) FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+            self._size += len(value) - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _expire(self):
+        if self.max_age is not None:
+            with self.db:
+                self.db.execute(
+                    "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)
+                )
+
+    def _evict(self):
+        """Drop expired, then least recently used entries until at 90% of `max_bytes`."""
+        self._expire()
+        self._size = self.db.execute(
+            "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM responses"
+        ).fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        with self.db:
+            for key, size in self.db.execute(
+                "SELECT key, LENGTH(value) FROM responses ORDER BY last_used"
+            ).fetchall():
+                if self._size <= target:
+                    break
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+
+    def clear(self, **kwargs):
+        with self._lock, self.db:
+            self.db.execute("DELETE FROM responses")
+            self._size = 0
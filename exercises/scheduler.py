@@ -0,0 +1,372 @@
+"""
+A rate-limit-aware scheduler for model requests.
+
+All model calls in a process (agents, `Send` fan-out workers, judges, sub-agents) go
+through one `Scheduler`, which
+
+* limits requests and tokens per minute with token buckets (`rpm`, `tpm`),
+* caps the number of requests in flight (`max_in_flight`),
+* admits waiting requests by priority class (`interactive` before `normal` before
+  `batch`) and in arrival order within a class,
+* retries rate-limited and transient failures with jittered exponential backoff
+  (honouring `Retry-After`), and
+* records queue depth, in-flight requests, wait times and retries (`stats()`).
+
+Token counts are estimated before a request and corrected with the reported usage
+afterwards. The priority of the calls made in a block is set with `priority`:
+
+    with priority("batch"):
+        run_gaia_eval()
+
+The priority is a context variable: asyncio tasks, LangGraph nodes (including `Send`
+workers) and the tool calls of `run_tool_calls` inherit it, plain threads and executors
+don't. Submit work to those with `submit`, which runs it in a copy of the caller's
+context.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from concurrent.futures import Executor, Future
+from typing import Any
+
+PRIORITIES = {"interactive": 0, "normal": 1, "batch": 2}
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_priority: contextvars.ContextVar[str | None] = contextvars.ContextVar("priority", default=None)
+
+
+@contextlib.contextmanager
+def priority(name: str):
+    """Run the model calls made in this block (and its tasks, see above) at `name`."""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{name}'. Choose one of {list(PRIORITIES)}.")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority(default: str = "normal") -> str:
+    return _priority.get() or default
+
+
+def submit(executor: Executor, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """`executor.submit` in a copy of the caller's context, so `fn` keeps its priority."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Rate limits and transient failures, by HTTP status or else by the exception's name
+    (case-insensitive: `openai.RateLimitError`, `ddgs.exceptions.RatelimitException`).
+
+        >>> class RatelimitException(Exception): ...
+        >>> is_retryable(RatelimitException("202 Ratelimit")), is_retryable(ValueError())
+        (True, False)
+    """
+    status = getattr(error, "status_code", None) or getattr(
+        getattr(error, "response", None), "status_code", None
+    )
+    if status is not None:
+        return status in RETRY_STATUS
+    name = type(error).__name__.lower()
+    return any(s in name for s in ("ratelimit", "timeout", "connection", "unavailable"))
+
+
+def retry_after(error: Exception) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+class TokenBucket:
+    """`rate` units per minute, with bursts of up to one minute's worth."""
+
+    def __init__(self, rate: float):
+        self.rate = rate / 60
+        self.capacity = rate
+        self.level = rate
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0: available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)  # a single oversized request must pass at some point
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self.level -= amount  # may go negative when usage exceeded the estimate
+
+
+class Scheduler:
+    def __init__(
+        self,
+        rpm: float | None = None,
+        tpm: float | None = None,
+        max_in_flight: int = 16,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.in_flight = 0
+        self.completed = 0
+        self.retries = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        self._lock = threading.Lock()
+        self._queue: list[tuple[int, int]] = []  # heap of (priority, ticket)
+        self._wakeups: dict[int, Callable[[], None]] = {}
+        self._tickets = itertools.count()
+        self._waits: dict[str, deque] = defaultdict(lambda: deque(maxlen=1000))
+
+    # admission
+
+    def _enqueue(self, priority: str, wakeup: Callable[[], None]) -> tuple[int, int]:
+        entry = (PRIORITIES[priority], next(self._tickets))
+        with self._lock:
+            heapq.heappush(self._queue, entry)
+            self._wakeups[entry[1]] = wakeup
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        return entry
+
+    def _try_admit(self, entry: tuple[int, int], tokens: float) -> float | None:
+        """Admit `entry` (returns 0), or return how long to wait (None: until notified)."""
+        with self._lock:
+            if self._queue[0] != entry or self.in_flight >= self.max_in_flight:
+                return None
+            delay = max(
+                self.requests.wait_time(1) if self.requests else 0.0,
+                self.tokens.wait_time(tokens) if self.tokens else 0.0,
+            )
+            if delay > 0:
+                return delay
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+            heapq.heappop(self._queue)
+            del self._wakeups[entry[1]]
+            self.in_flight += 1
+        self._notify()  # the next request in the queue may be admitted too
+        return 0.0
+
+    def _notify(self):
+        # only the request at the head of the queue can be admitted next
+        with self._lock:
+            wakeup = self._wakeups[self._queue[0][1]] if self._queue else None
+        if wakeup is not None:
+            wakeup()
+
+    def _dequeue(self, entry: tuple[int, int]):
+        """Give up the place of `entry` (a wait cut short by an error or cancellation)."""
+        with self._lock:
+            if entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                del self._wakeups[entry[1]]
+        self._notify()
+
+    def _record_wait(self, priority: str, started: float):
+        with self._lock:
+            self._waits[priority].append(time.monotonic() - started)
+
+    def acquire(self, tokens: float = 0, priority: str = "normal"):
+        started = time.monotonic()
+        event = threading.Event()
+        entry = self._enqueue(priority, event.set)
+        try:
+            while True:
+                event.clear()
+                delay = self._try_admit(entry, tokens)
+                if delay == 0:
+                    break
+                event.wait(delay)
+        except BaseException:  # e.g. KeyboardInterrupt in a notebook cell
+            self._dequeue(entry)
+            raise
+        self._record_wait(priority, started)
+
+    async def aacquire(self, tokens: float = 0, priority: str = "normal"):
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        entry = self._enqueue(priority, lambda: loop.call_soon_threadsafe(event.set))
+        try:
+            while True:
+                event.clear()
+                delay = self._try_admit(entry, tokens)
+                if delay == 0:
+                    break
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(event.wait(), delay)
+        except BaseException:  # e.g. asyncio.CancelledError
+            self._dequeue(entry)
+            raise
+        self._record_wait(priority, started)
+
+    def release(self, estimated: float = 0, used: float | None = None):
+        """Finish an admitted request; `used` corrects the token estimate."""
+        with self._lock:
+            self.in_flight -= 1
+            if self.tokens and used is not None:
+                self.tokens.take(used - estimated)
+        self._notify()
+
+    # execution with retries
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        return max(delay, retry_after(error) or 0.0)
+
+    def _should_retry(self, attempt: int, error: Exception) -> bool:
+        retry = attempt < self.max_retries and is_retryable(error)
+        with self._lock:
+            if retry:
+                self.retries += 1
+            else:
+                self.failed += 1
+        return retry
+
+    def run(
+        self,
+        call: Callable[[], Any],
+        tokens: float = 0,
+        priority: str | None = None,
+        usage: Callable[[Any], float | None] = lambda result: None,
+    ) -> Any:
+        """Run `call` once admitted, retrying rate-limited and transient failures."""
+        priority = priority or current_priority()
+        for attempt in itertools.count():
+            self.acquire(tokens, priority)
+            used = None
+            try:
+                result = call()
+                used = usage(result)
+                with self._lock:
+                    self.completed += 1
+                return result
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                delay = self.backoff(attempt, e)
+            finally:
+                self.release(tokens, used)
+            time.sleep(delay)
+
+    async def arun(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        tokens: float = 0,
+        priority: str | None = None,
+        usage: Callable[[Any], float | None] = lambda result: None,
+    ) -> Any:
+        priority = priority or current_priority()
+        for attempt in itertools.count():
+            await self.aacquire(tokens, priority)
+            used = None
+            try:
+                result = await call()
+                used = usage(result)
+                with self._lock:
+                    self.completed += 1
+                return result
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                delay = self.backoff(attempt, e)
+            finally:
+                self.release(tokens, used)
+            await asyncio.sleep(delay)
+
+    def stream(
+        self, call: Callable[[], Iterator], tokens: float = 0, priority: str | None = None
+    ) -> Iterator:
+        """
+        Yield from `call()` once admitted. The request counts as in flight until the stream
+        ends; it is only retried if it fails before the first item.
+        """
+        priority = priority or current_priority()
+        for attempt in itertools.count():
+            self.acquire(tokens, priority)
+            started = False
+            try:
+                for item in call():
+                    started = True
+                    yield item
+                with self._lock:
+                    self.completed += 1
+                return
+            except Exception as e:
+                if started or not self._should_retry(attempt, e):
+                    raise
+                delay = self.backoff(attempt, e)
+            finally:
+                self.release(tokens)
+            time.sleep(delay)
+
+    async def astream(
+        self, call: Callable[[], AsyncIterator], tokens: float = 0, priority: str | None = None
+    ) -> AsyncIterator:
+        priority = priority or current_priority()
+        for attempt in itertools.count():
+            await self.aacquire(tokens, priority)
+            started = False
+            try:
+                async for item in call():
+                    started = True
+                    yield item
+                with self._lock:
+                    self.completed += 1
+                return
+            except Exception as e:
+                if started or not self._should_retry(attempt, e):
+                    raise
+                delay = self.backoff(attempt, e)
+            finally:
+                self.release(tokens)
+            await asyncio.sleep(delay)
+
+    # metrics
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_queue_depth,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "retries": self.retries,
+                "failed": self.failed,
+            }
+            for name, waits in self._waits.items():
+                if waits:
+                    stats[f"wait_p50_ms_{name}"] = 1000 * percentile(waits, 50)
+                    stats[f"wait_p95_ms_{name}"] = 1000 * percentile(waits, 95)
+        return stats
@@ -0,0 +1,241 @@
+"""
+One web search service for the exercises and labs.
+
+`SearchService` puts the search backend behind
+
+* a persistent result cache (SQLite), keyed by the normalized query (Unicode NFKC,
+  case-folded, collapsed whitespace), the number of results and the backend, with
+  entries expiring after `ttl` seconds,
+* a `Scheduler` (see `scheduler.py`) that limits requests per minute (`rpm`) and in
+  flight (`max_concurrency`) and retries rate-limited and timed out requests with
+  backoff, and
+* `search_many`, which runs the uncached queries of a batch concurrently.
+
+Backends are objects with a `name` and a `search(query, max_results)` method returning
+`{"title", "href", "body"}` dicts: `DDGSBackend` (DuckDuckGo & co. via `ddgs`, one client
+per thread, reused across calls) or `FixtureBackend` (offline: results from a JSON file,
+else deterministic placeholders).
+
+`search_service()` is the service shared by a process, configured with the environment
+variables `SEARCH_BACKEND` (`ddgs` or `fixture`, default: `fixture` when
+`LLM_BACKEND=fake`, else `ddgs`), `SEARCH_CACHE` (default `.cache/search.sqlite`, `off`
+to disable), `SEARCH_RPM` (default 60) and `SEARCH_FIXTURES`.
+
+    from search_service import format_results, search_service
+    results = search_service().search("What is Altana?")
+    batches = search_service().search_many(["altana funding", "altana founders"])
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Protocol
+
+from scheduler import Scheduler
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_results (
+    key TEXT PRIMARY KEY,
+    results TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "search_fixtures.json")
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip().casefold()
+
+
+def format_results(results: list[dict[str, Any]]) -> str:
+    """The results as text for a model: title, URL and snippet per result."""
+    if not results:
+        return "No results found."
+    return "\n\n".join(
+        f"{r.get('title', '')}\n{r.get('href', '')}\n{r.get('body', '')}".strip() for r in results
+    )
+
+
+class SearchBackend(Protocol):
+    name: str
+
+    def search(self, query: str, max_results: int) -> list[dict[str, Any]]: ...
+
+
+class DDGSBackend:
+    """Metasearch via `ddgs`; each thread reuses its own client (and connections)."""
+
+    name = "ddgs"
+
+    def __init__(self, timeout: float = 10, backend: str = "auto"):
+        self.timeout = timeout
+        self.backend = backend
+        self._local = threading.local()
+
+    def search(self, query: str, max_results: int) -> list[dict[str, Any]]:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            from ddgs import DDGS
+
+            client = self._local.client = DDGS(timeout=self.timeout)
+        return client.text(query, max_results=max_results, backend=self.backend)
+
+
+class FixtureBackend:
+    """
+    Offline results: the entries of a JSON file (normalized query -> results), else
+    deterministic placeholder results. `latency` simulates the network.
+    """
+
+    name = "fixture"
+
+    def __init__(self, path: str = FIXTURES, latency: float = 0.0):
+        self.latency = latency
+        self.fixtures: dict[str, list[dict[str, Any]]] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.fixtures = {normalize_query(q): r for q, r in json.load(f).items()}
+
+    def search(self, query: str, max_results: int) -> list[dict[str, Any]]:
+        time.sleep(self.latency)
+        key = normalize_query(query)
+        if key in self.fixtures:
+            return self.fixtures[key][:max_results]
+        slug = re.sub(r"\W+", "-", key).strip("-") or "query"
+        return [
+            {
+                "title": f"{query.strip()} ({i + 1})",
+                "href": f"https://example.com/{slug}/{i + 1}",
+                "body": f"Offline placeholder result {i + 1} for '{query.strip()}'.",
+            }
+            for i in range(max_results)
+        ]
+
+
+class SearchService:
+    def __init__(
+        self,
+        backend: SearchBackend,
+        cache_path: str | None = ".cache/search.sqlite",
+        ttl: float | None = 24 * 3600,
+        rpm: float | None = 60,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_concurrency = max_concurrency
+        self.scheduler = Scheduler(
+            rpm=rpm, max_in_flight=max_concurrency, max_retries=max_retries, max_delay=30
+        )
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix="search")
+        self.db = None
+        if cache_path:
+            if os.path.dirname(cache_path):
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            self.db = sqlite3.connect(cache_path, check_same_thread=False)
+            self.db.executescript(SCHEMA)
+
+    def key(self, query: str, max_results: int) -> str:
+        data = f"{self.backend.name}\0{max_results}\0{normalize_query(query)}"
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _lookup(self, key: str) -> list[dict[str, Any]] | None:
+        if self.db is None:
+            return None
+        with self._lock:
+            row = self.db.execute(
+                "SELECT results, created FROM search_results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def _store(self, key: str, results: list[dict[str, Any]]):
+        if self.db is None:
+            return
+        with self._lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO search_results VALUES (?, ?, ?)",
+                (key, json.dumps(results), time.time()),
+            )
+
+    def search(self, query: str, max_results: int = 5) -> list[dict[str, Any]]:
+        """The results for `query`, from the cache or the backend."""
+        key = self.key(query, max_results)
+        results = self._lookup(key)
+        if results is None:
+            results = self.scheduler.run(lambda: self.backend.search(query, max_results))
+            self._store(key, results)
+        return results
+
+    def search_many(self, queries: list[str], max_results: int = 5) -> list[list[dict[str, Any]]]:
+        """The results for each query; duplicates are searched once, the rest concurrently."""
+        unique = {normalize_query(query): query for query in queries}
+        found = dict(
+            zip(
+                unique,
+                self._executor.map(lambda query: self.search(query, max_results), unique.values()),
+            )
+        )
+        return [found[normalize_query(query)] for query in queries]
+
+    async def asearch(self, query: str, max_results: int = 5) -> list[dict[str, Any]]:
+        return await asyncio.to_thread(self.search, query, max_results)
+
+    async def asearch_many(
+        self, queries: list[str], max_results: int = 5
+    ) -> list[list[dict[str, Any]]]:
+        return await asyncio.to_thread(self.search_many, queries, max_results)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            **self.scheduler.stats(),
+        }
+
+
+_service: SearchService | None = None
+_service_lock = threading.Lock()
+
+
+def search_service() -> SearchService:
+    """The search service shared by this process (see the module docstring)."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            offline = os.environ.get("LLM_BACKEND") == "fake"
+            kind = os.environ.get("SEARCH_BACKEND") or ("fixture" if offline else "ddgs")
+            if kind == "fixture":
+                backend = FixtureBackend(
+                    os.environ.get("SEARCH_FIXTURES", FIXTURES),
+                    latency=float(os.environ.get("SEARCH_FAKE_LATENCY", "0")),
+                )
+            elif kind == "ddgs":
+                backend = DDGSBackend()
+            else:
+                raise ValueError(f"Unknown SEARCH_BACKEND '{kind}'. Choose 'ddgs' or 'fixture'.")
+            cache = os.environ.get("SEARCH_CACHE", ".cache/search.sqlite")
+            _service = SearchService(
+                backend,
+                cache_path=cache if cache not in ("", "0", "off") else None,
+                rpm=float(os.environ.get("SEARCH_RPM", "60")),
+            )
+        return _service
@@ -0,0 +1,123 @@
+"""
+A semantic cache for RAG queries.
+
+Incoming queries are embedded and compared (cosine similarity) with the queries seen
+before; when the closest one is within `threshold`, its cached value (e.g. the retrieved
+context and, optionally, the generated answer) is returned instead of running the
+pipeline again. Entries expire after `ttl` seconds and the least recently used entry is
+evicted once `max_entries` is reached.
+
+Callers that also need the query vector (e.g. for the search) embed the query once with
+`embed` and pass the vector to `get` and `put`. `set_version` drops all entries when the
+data behind them changes (e.g. the generation of the index).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = 0.95,
+        max_entries: int = 1024,
+        ttl: float | None = 3600,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # slot -> (query, value, expires_at); ordered from least to most recently used
+        self._entries: OrderedDict[int, tuple[str, Any, float]] = OrderedDict()
+        self._vectors: np.ndarray | None = None  # (max_entries, dim), one row per slot
+        self._used = np.zeros(max_entries, dtype=bool)
+        self.version: Any = None
+
+    def embed(self, query: str) -> np.ndarray:
+        """The normalized query vector, as expected by `get` and `put`."""
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _drop(self, slot: int):
+        del self._entries[slot]
+        self._used[slot] = False
+
+    def _match(self, vector: np.ndarray) -> int | None:
+        """The slot of the most similar live entry within `threshold` (under the lock)."""
+        now = time.time()
+        for slot, (_, _, expires) in list(self._entries.items()):
+            if expires < now:
+                self._drop(slot)
+        if not self._entries:
+            return None
+        scores = np.where(self._used, self._vectors @ vector, -np.inf)
+        slot = int(np.argmax(scores))
+        return slot if scores[slot] >= self.threshold else None
+
+    def get(self, query: str, vector: np.ndarray | None = None) -> Any | None:
+        """The cached value of the most similar previous query, or None."""
+        vector = self.embed(query) if vector is None else vector
+        with self._lock:
+            slot = self._match(vector)
+            if slot is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return self._entries[slot][1]
+
+    def put(self, query: str, value: Any, vector: np.ndarray | None = None):
+        """
+        Cache `value` for `query`. If `get` would match an entry already (e.g. one that
+        held only the context), that entry gets the new value, with its expiry unchanged.
+        """
+        vector = self.embed(query) if vector is None else vector
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            slot = self._match(vector)
+            if slot is not None:
+                matched, _, expires = self._entries[slot]
+                self._entries[slot] = (matched, value, expires)
+                self._entries.move_to_end(slot)
+                return
+            if len(self._entries) >= self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            slot = int(np.argmin(self._used))
+            self._vectors[slot] = vector
+            self._used[slot] = True
+            expires = time.time() + self.ttl if self.ttl is not None else float("inf")
+            self._entries[slot] = (query, value, expires)
+
+    def set_version(self, version: Any):
+        """Drop all entries if `version` differs from the previous call's."""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self._used[:] = False
+                self.version = version
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
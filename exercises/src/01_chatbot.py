@@ -15,7 +15,7 @@
 # to invoke it.
 
 # %%
-from langchain.messages import AIMessage, HumanMessage
+from langchain.messages import HumanMessage
 
 from llm import model
 
@@ -23,6 +23,12 @@ response = model.invoke("hi")
 print(response.content)
 
 
+# %% [markdown]
+# Resending the whole conversation on every turn makes each turn slower and more expensive
+# than the last, and long sessions eventually overflow the context window. `ChatHistory`
+# (in `chat_history.py`) keeps the recent turns within a token budget and folds older
+# turns into a summary, which the model updates in the background.
+
 # %%
 # Exercise 1: Console Chatbot
 #
@@ -30,11 +36,13 @@ print(response.content)
 #
 # Fill in the lines inside <solution></solution>.
 #
+from chat_history import ChatHistory
+from scheduler import priority
 
 
 def chat_shell():
-    # Initialize chat history
-    chat_history: list[HumanMessage | AIMessage] = []
+    # Initialize chat history: recent turns within 2000 tokens plus a summary of older ones
+    chat_history = ChatHistory(model, max_tokens=2000)
 
     while True:
         user_input = input("User: ")
@@ -47,9 +55,11 @@ def chat_shell():
         # </solution>
 
         # Exercise 1.2: Invoke the model to get a response.
-        # Hint: Use `model.invoke(...)`
+        # Hint: Use `model.invoke(...)` with `chat_history.to_messages()`
         # <solution>
-        response = model.invoke(chat_history)
+        # the user is waiting: ahead of batch work sharing the model (see `scheduler.py`)
+        with priority("interactive"):
+            response = model.invoke(chat_history.to_messages())
         # </solution>
         print(f"AI: {response.content}")
 
@@ -72,10 +82,16 @@ chat_shell()
 # Then we create a requirements.txt file, an app.yaml file and finally the app.py file.
 # The app.yaml file defines the command to run the app.py file.
 # The requirements.txt file defines the dependencies.
+# The app also uses `chat_history.py`, which we copy into the directory.
 
 # %%
 # %mkdir streamlit_app_01
 
+# %%
+import shutil
+
+shutil.copy("chat_history.py", "streamlit_app_01/chat_history.py")
+
 # %%
 # %%writefile streamlit_app_01/requirements.txt
 # databricks-langchain
@@ -89,27 +105,52 @@ chat_shell()
 # %%
 # %%writefile streamlit_app_01/app.py
 import streamlit as st
+from chat_history import ChatHistory
+from databricks_langchain import ChatDatabricks
 from langchain_core.messages import AIMessage, HumanMessage
 
+PAGE_SIZE = 50  # messages rendered per page of history
+
 st.title("Chatbot")
 
+
+@st.cache_resource
+def get_model():
+    # one client per process, shared by all sessions and reruns
+    return ChatDatabricks(endpoint="databricks-claude-sonnet-4-5")
+
+
 # Exercise 2.1: Invoke the model with the message history
 # <solution>
 if "messages" not in st.session_state:
-    st.session_state.messages = []
-
-for message in st.session_state.messages:
+    st.session_state.messages = []  # everything, for display
+    # what is sent to the model: recent turns plus a summary of older ones
+    st.session_state.history = ChatHistory(get_model(), max_tokens=2000)
+    st.session_state.shown = PAGE_SIZE
+
+# Streamlit reruns the script on every interaction: only render the latest messages
+messages = st.session_state.messages
+hidden = max(0, len(messages) - st.session_state.shown)
+if hidden and st.button(f"Show earlier messages ({hidden} hidden)"):
+    st.session_state.shown += PAGE_SIZE
+    st.rerun()
+
+for message in messages[hidden:]:
     with st.chat_message("user" if isinstance(message, HumanMessage) else "assistant"):
         st.markdown(message.content)
 
 if prompt := st.chat_input("What is up?"):
-    st.session_state.messages.append(HumanMessage(content=prompt))
+    history = st.session_state.history
+    messages.append(HumanMessage(content=prompt))
+    history.append(HumanMessage(content=prompt))
     with st.chat_message("user"):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        model = ChatDatabricks(endpoint="databricks-claude-sonnet-4-5")
-        response = model.invoke(st.session_state.messages)
-        st.markdown(response.content)
-        st.session_state.messages.append(response)
+        # stream the tokens into the bubble as they arrive
+        stream = get_model().stream(history.to_messages())
+        text = st.write_stream(chunk.text for chunk in stream)
+        response = AIMessage(content=text)
+        messages.append(response)
+        history.append(response)
 # </solution>
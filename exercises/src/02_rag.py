@@ -12,73 +12,144 @@
 import glob
 import os
 
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_community.vectorstores import InMemoryVectorStore
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from bm25 import reciprocal_rank_fusion
+from context_packing import pack_context
+from ingest import PdfIngestor
 from llm import embeddings as embed
 from llm import model
+from semantic_cache import SemanticCache
+from vector_store import PersistentVectorStore
+
+
+# %% [markdown]
+# The vectorstore is persisted to `data/index`: an embedding matrix that is memory-mapped
+# and a SQLite table with the chunks. Each PDF is keyed by its content hash, so restarting
+# only re-embeds PDFs that were added or changed, and drops the ones that were deleted.
+#
+# PDFs are ingested in parallel: pages are extracted in a process pool and streamed through
+# the splitter into embedding batches, so memory stays bounded for large knowledge bases.
+#
+# Searching uses exact scoring for small corpora and an approximate (IVF) index for large
+# ones. Pass e.g. `backend="ivf", n_probe=16` to `PersistentVectorStore` to tune recall vs. speed,
+# and `storage="int8"` (or `"float16"`) to keep a compact copy of the embeddings in memory.
+# Alongside the embeddings, `sync` builds a BM25 keyword index, so queries for exact product
+# codes like "BYK-388" can be answered without raising `k`.
+#
+# To compare store backends and chunking settings offline, run `python bench_rag.py --help`.
 
 
 # %%
 def create_vectorstore():
     pdf_folder = "data/knowledge_base"
-    documents = []
 
     if not os.path.exists(pdf_folder):
         print(f"Warning: {pdf_folder} not found.")
         return None
 
-    # Exercise 2.1: Load all PDFs from the folder
-    # Hint: Use `PyMuPDFLoader(file).load()`
-    for file in glob.glob(f"{pdf_folder}/*.pdf"):
-        # <solution>
-        loader = PyMuPDFLoader(file)
-        documents.extend(loader.load())
-        # </solution>
-
-    if not documents:
+    files = sorted(glob.glob(f"{pdf_folder}/*.pdf"))
+    if not files:
         print("No documents found.")
         return None
 
-    # Exercise 2.2: Split documents
+    # Exercise 2.1: Create a text splitter
     # Hint: Use `RecursiveCharacterTextSplitter`
     # <solution>
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    splits = text_splitter.split_documents(documents)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000, chunk_overlap=200, add_start_index=True
+    )
+    # </solution>
+
+    # Exercise 2.2: Create the ingestion pipeline.
+    # `PdfIngestor` extracts the pages in a process pool (using `PyMuPDFLoader`) and
+    # streams them through the splitter into batches for the embedding model.
+    # <solution>
+    ingestor = PdfIngestor(text_splitter, batch_size=256)
     # </solution>
 
     # Exercise 2.3: Create vectorstore.
-    # Hint: Use the `InMemoryVectorStore` constructor.
+    # Hint: Use the `PersistentVectorStore` constructor and sync it with the PDFs.
     # <solution>
-    vectorstore = InMemoryVectorStore.from_documents(
-        documents=splits,
-        embedding=embed,
-    )
+    vectorstore = PersistentVectorStore("data/index", embedding=embed)
+    vectorstore.sync(files, ingestor.batches)
     # </solution>
+    if ingestor.stats.files:
+        ingestor.stats.report()
     return vectorstore
 
 
 # %%
-def retrieve(vectorstore, query: str):
-    # Exercise 2.4: Implement a retriever using the vectorstore.
+def retrieve_documents(vectorstore, query: str, k: int = 4, vector=None):
+    # Exercise 2.4: Implement a hybrid retriever using the vectorstore.
+    # Hint: Combine `vectorstore.similarity_search(...)` (dense; with
+    # `similarity_search_by_vector(vector, ...)` if the query is already embedded) and
+    # `vectorstore.lexical_search(...)` (BM25, good at exact product codes)
+    # using `reciprocal_rank_fusion`.
     # <solution>
-    retriever = vectorstore.as_retriever()
-    matching_docs = retriever.invoke(query)
+    if vector is None:
+        dense = vectorstore.similarity_search(query, k=2 * k)
+    else:
+        dense = vectorstore.similarity_search_by_vector(vector, k=2 * k)
+    lexical = vectorstore.lexical_search(query, k=2 * k)
+    matching_docs = reciprocal_rank_fusion([dense, lexical])[:k]
     # </solution>
-    return [doc.page_content for doc in matching_docs]
+    return matching_docs
+
+
+def retrieve(vectorstore, query: str, k: int = 4) -> list[str]:
+    # the text of the chunks; `retrieve_documents` keeps their metadata (source, page, ...)
+    return [doc.page_content for doc in retrieve_documents(vectorstore, query, k)]
+
+
+# %% [markdown]
+# When several agents need context at the same time, `retrieve_many` scores all queries
+# against the stored embeddings together, instead of scanning the index once per query.
 
 
 # %%
-def main():
-    # Initialize
-    vectorstore = create_vectorstore()
-    if not vectorstore:
-        return
+def retrieve_many(vectorstore, queries: list[str], k: int = 4):
+    dense = vectorstore.similarity_search_many(queries, k=2 * k)
+    return [
+        [
+            doc.page_content
+            for doc in reciprocal_rank_fusion(
+                [dense_docs, vectorstore.lexical_search(query, k=2 * k)]
+            )[:k]
+        ]
+        for query, dense_docs in zip(queries, dense)
+    ]
 
-    query = "What surface additives have excellent leveling properties?"
-    context = retrieve(vectorstore, query)
+
+# %% [markdown]
+# Many questions arrive several times, phrased slightly differently. A semantic cache in
+# front of the pipeline embeds each query and, if a previous query is similar enough, returns
+# its retrieved context (and, if `cache_answers` is set, its answer) without running
+# retrieval or the model again. The query is embedded once, for the cache and the search,
+# and the cache is emptied whenever the index changes, so it never answers from removed
+# documents.
+#
+# Retrieved chunks overlap by up to 200 characters and are often neighbours on the same page.
+# Before prompting, `pack_context` merges overlapping chunks of a page, drops duplicates and
+# fills a token budget in relevance order.
+
+# %%
+CONTEXT_TOKENS = 1500
+query_cache = SemanticCache(embed, threshold=0.95, max_entries=1024, ttl=24 * 3600)
+
+
+def answer(vectorstore, query: str, cache_answers: bool = True) -> str:
+    query_cache.set_version(vectorstore.generation)
+    vector = query_cache.embed(query)
+    cached = query_cache.get(query, vector=vector)
+    if cached and cached["answer"] is not None:
+        return cached["answer"]
+    if cached:
+        context = cached["context"]
+    else:
+        docs = retrieve_documents(vectorstore, query, k=8, vector=vector)
+        context = pack_context(docs, max_tokens=CONTEXT_TOKENS)
 
     # Exercise 2.5: Generate Answer
     prompt = ChatPromptTemplate.from_template(
@@ -86,10 +157,29 @@ def main():
     )
     # <solution>
     chain = prompt | model
-    response = chain.invoke({"context": "\n".join(context), "question": query})
+    response = chain.invoke({"context": context, "question": query})
     # </solution>
+
+    # on a hit without answer, this fills in the answer of the matched entry
+    query_cache.put(
+        query,
+        {"context": context, "answer": response.content if cache_answers else None},
+        vector=vector,
+    )
+    return response.content
+
+
+# %%
+def main():
+    # Initialize
+    vectorstore = create_vectorstore()
+    if not vectorstore:
+        return
+
+    query = "What surface additives have excellent leveling properties?"
     print(f"Question: {query}")
-    print(f"Answer: {response.content}")
+    print(f"Answer: {answer(vectorstore, query)}")
+    print(f"Query cache: {query_cache.stats()}")
 
 
 if __name__ == "__main__":
@@ -14,6 +14,7 @@ from langchain.tools import tool
 
 # %%
 from llm import model
+from tool_cache import cacheable
 
 # %% [markdown]
 # ## Tools
@@ -28,7 +29,10 @@ from llm import model
 # %%
 # Exercise 3.1: Define a tool using the decorator. The tool should return the weather for a location.
 # You can simply return a string for now (e.g. "Cloudy, 15C").
+# The weather changes, so repeated calls are only answered from the cache for 10 minutes
+# (see `tool_cache.py`).
 # <solution>
+@cacheable(ttl=600)
 @tool
 def get_weather(location: str) -> str:
     """Get the weather for a location."""
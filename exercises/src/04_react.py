@@ -13,31 +13,34 @@
 # %restart_python
 
 # %%
-import operator
-from typing import Literal
-
 from langchain.messages import AnyMessage, HumanMessage, SystemMessage, ToolMessage
 from langchain.tools import BaseTool, tool
-from langgraph.graph import END, START, StateGraph
-from typing_extensions import Annotated, TypedDict
 
 # %%
 from llm import model
+from tool_cache import cacheable
 
 # %% [markdown]
 # ## Tools
 #
 # Let's define a couple tools.
 #
+# Agents often call a tool again with the same arguments. Tools without side effects can
+# be marked `@cacheable` (from `tool_cache.py`, on top of `@tool`): repeated calls are
+# then answered from a cache, optionally persisted across runs and expiring after `ttl`
+# seconds. Hits show up as `tool_cache_hit` events in the trace.
+#
 
 
 # %%
+@cacheable()
 @tool
 def multiply(a: int, b: int) -> int:
     """Multiply `a` and `b`.Args: a: First int, b: Second int"""
     return a * b
 
 
+@cacheable()
 @tool
 def add(a: int, b: int) -> int:
     """Adds `a` and `b`.Args: a: First int, b: Second int"""
@@ -47,6 +50,7 @@ def add(a: int, b: int) -> int:
 # Exercise 4.1: Define the divide tool
 # Hint: Use the @tool decorator. The function should take two ints and return a float.
 # <solution>
+@cacheable()
 @tool
 def divide(a: int, b: int) -> float:
     """Divide `a` and `b`.Args: a: First int, b: Second int"""
@@ -67,90 +71,39 @@ def divide(a: int, b: int) -> float:
 # For the ReAct agent, we'll loop between LLM calls and tool calls. The loop
 # ends when the LLM does not emit any tool calls (and thus has provided the final answer).
 #
+# `build_agent` in `react_async.py` builds this graph (the benchmark `bench_react.py`
+# and the load test `load_test_react.py` use the same builder):
+#
+# * the state holds the `messages` and counts the `llm_calls`,
+# * the `llm_call` node sends the system prompt and the messages to the model (with the
+#   tools bound),
+# * the `tool_node` node runs the tool calls of the last message with `call_tool`; the
+#   calls of one step are independent, so they run concurrently (at most 8 at a time,
+#   each for at most 60s) and the messages keep the order of the tool calls,
+# * a conditional edge (`should_continue`) goes from `llm_call` to `tool_node` if the
+#   last message has tool calls, else to `END`, and `tool_node` leads back to `llm_call`.
 
 
 # %%
+from react_async import build_agent
+
 # the agent will have these tools
 tools = [add, multiply, divide]
 
 
-def build_agent(tools: list[BaseTool]):
-    tools_by_name = {tool.name: tool for tool in tools}
-    model_with_tools = model.bind_tools(tools)
-
-    # State
-    class MessagesState(TypedDict):
-        messages: Annotated[list[AnyMessage], operator.add]
-        llm_calls: int
-
-    # Nodes
-    def llm_call(state: dict):
-        """LLM decides whether to call a tool or not"""
-        return {
-            "messages": [
-                model_with_tools.invoke(
-                    [
-                        SystemMessage(
-                            content="You are a helpful assistant tasked with performing arithmetic on a set of inputs."
-                        )
-                    ]
-                    + state["messages"]
-                )
-            ],
-            "llm_calls": state.get("llm_calls", 0) + 1,
-        }
-
-    def tool_node(state: dict):
-        """Performs the tool call"""
-        result = []
-        for tool_call in state["messages"][-1].tool_calls:
-            # Exercise 4.2: Handle the tool call. That is, call the function with the arguments
-            # requested by the LLM and add the result (as a `ToolMessage`) to the conversation history.
-            # <solution>
-            tool = tools_by_name[tool_call["name"]]
-            observation = tool.invoke(tool_call["args"])
-            result.append(
-                ToolMessage(content=observation, tool_call_id=tool_call["id"])
-            )
-            # </solution>
-        return {"messages": result}
-
-    # Exercise 4.3: Define conditional logic
-    # Hint: Check if the last message in state["messages"] has `tool_calls`.
-    def should_continue(state: MessagesState) -> Literal["tool_node", END]:
-        """Decide if we should continue the loop or stop"""
-        messages = state["messages"]
-        last_message = messages[-1]
-        # <solution>
-        if last_message.tool_calls:
-            return "tool_node"
-        return END
-        # </solution>
-
-    # Exercise 4.4: Initialize graph and add nodes
-    # Hint: Use StateGraph(MessagesState). Add nodes using .add_node("name", function).
-    # <solution>
-    agent_builder = StateGraph(MessagesState)
-    agent_builder.add_node("llm_call", llm_call)
-    agent_builder.add_node("tool_node", tool_node)
-    # </solution>
-
-    # Exercise 4.5: Add edges
-    # Hint: Use .add_edge(start, end) and .add_conditional_edges(source, condition, path_map).
-    # Connect START -> llm_call, then conditionally to tool_node or END, and tool_node back to llm_call.
+def call_tool(tool: BaseTool, tool_call: dict) -> ToolMessage:
+    # Exercise 4.2: Handle the tool call. That is, call the function with the arguments
+    # requested by the LLM and return the result as a `ToolMessage`.
     # <solution>
-    agent_builder.add_edge(START, "llm_call")
-    agent_builder.add_conditional_edges("llm_call", should_continue, ["tool_node", END])
-    agent_builder.add_edge("tool_node", "llm_call")
+    observation = tool.invoke(tool_call["args"])
+    return ToolMessage(content=observation, tool_call_id=tool_call["id"])
     # </solution>
 
-    return agent_builder.compile()
 
-
-# Exercise 4.6: Compile the graph
-# Hint: Call .compile() on the graph builder.
+# Exercise 4.3: Build the agent.
+# Hint: Pass the model, the tools and your `call_tool` (as `call`) to `build_agent`.
 # <solution>
-agent = build_agent(tools)
+agent = build_agent(model, tools, call=call_tool)
 # </solution>
 
 
@@ -158,7 +111,7 @@ agent = build_agent(tools)
 # Let's run this query
 math_query = "Calculate ((144 / 12) * (25 + 75)) / ((10 * 10) / (500 / 5)) + ((81 / 9) * (121 / 11))"
 
-# Exercise 4.7: Invoke the agent.
+# Exercise 4.4: Invoke the agent.
 # Hint: Initialize the conversation history with the query wrapped in a `HumanMessage` and use agent.invoke({"messages": messages})
 # <solution>
 messages = [HumanMessage(content=math_query)]
@@ -168,29 +121,51 @@ response = agent.invoke({"messages": messages})
 # show the message history
 for m in response["messages"]:
     m.pretty_print()
+print(f"LLM calls: {response['llm_calls']}")
+
+# %% [markdown]
+# ## Batching: one tool call for the whole expression
+#
+# With `add`, `multiply` and `divide`, every operation needs a tool call, and every
+# round of tool calls another LLM call. The `calculate` tool (`calculator.py`) evaluates
+# whole expressions, or a batch of independent ones, exactly and safely (no `eval`), so
+# the agent can answer after a single tool call. Compare the `llm_calls` of the two runs;
+# `python bench_react.py` measures the difference on more queries.
+
+# %%
+from calculator import calculate
+
+agent = build_agent(model, [calculate], call=call_tool)
+response = agent.invoke({"messages": [HumanMessage(content=math_query)]})
+for m in response["messages"]:
+    m.pretty_print()
+print(f"LLM calls: {response['llm_calls']}")
 
 
 # %%
-# Exercise 4.8: Create another agent, with the ability to search the web.
+# Exercise 4.5: Create another agent, with the ability to search the web.
 #
-from ddgs import DDGS
+# Searches go through the shared search service (`search_service.py`): results are
+# cached on disk, requests are rate-limited and retried, and with `LLM_BACKEND=fake` the
+# results come from local fixtures.
+from search_service import format_results, search_service
 
 
-# Exercise 4.9: Use the above to create a search tool
+# Exercise 4.6: Use the above to create a search tool
 # <solution>
 @tool
 def web_search(query: str, max_results: int = 5):
     """Run a web search"""
-    return str(DDGS().text(query, max_results=max_results))
+    return format_results(search_service().search(query, max_results=max_results))
 
 
 # </solution>
 
 # %%
 search_query = "What is Altana?"
-# Exercise 4.9: Build and invoke the agent.
+# Exercise 4.6: Build and invoke the agent.
 # <solution>
-agent = build_agent([web_search])
+agent = build_agent(model, [web_search], call=call_tool)
 messages = [HumanMessage(content=search_query)]
 response = agent.invoke({"messages": messages})
 # </solution>
@@ -270,7 +245,64 @@ for chunk in agent.stream(messages, stream_mode="updates"):
 
 
 # %% [markdown]
-# # Exercise 4.10 (Bonus): Turn the agent into a chatbot.
+# ## Async agents: many conversations per event loop
+#
+# `build_agent` and `build_agent_func` block a thread per conversation while they wait
+# for the model and the tools. `react_async.py` has async versions of both builders
+# (`build_agent_async`, `build_agent_func_async`): their nodes `await` the model
+# (`ainvoke`) and the tools, which may be coroutines, so the compiled graphs support
+# `ainvoke` and `astream`, and a single event loop can interleave hundreds of agent runs.
+# `python load_test_react.py` measures the throughput of the builders with the offline
+# models.
+#
+# Notebooks already run an event loop (and `asyncio.run` can't be nested), so `run_async`
+# runs the async agents on a loop of its own, in a background thread.
+#
+# The scheduler of `llm_factory.py` still caps the model calls in flight at
+# `LLM_MAX_IN_FLIGHT` (default 16) per process; the rest wait for a slot. Raise it (before
+# the first model call) to run more conversations at once.
+
+
+# %%
+import asyncio
+
+from react_async import build_agent_async, build_agent_func_async, run_async
+
+
+# A tool can be a coroutine, too: it then waits for the search without blocking a thread.
+@tool("web_search")
+async def web_search_async(query: str, max_results: int = 5):
+    """Run a web search"""
+    return format_results(await search_service().asearch(query, max_results=max_results))
+
+
+# %%
+async def ask_all(agent, queries: list[str]) -> list[dict]:
+    # all conversations at once: while one waits for the model, the others make progress
+    return await asyncio.gather(
+        *(agent.ainvoke({"messages": [HumanMessage(content=query)]}) for query in queries)
+    )
+
+
+agent = build_agent_async(model, [add, multiply, divide])
+queries = [math_query, "Calculate (3 + 4) * (5 + 6)", "Calculate 2 * (10 / 4)"]
+for query, response in zip(queries, run_async(ask_all(agent, queries))):
+    print(f"{query}\n  -> {response['messages'][-1].text} ({response['llm_calls']} LLM calls)")
+
+
+# %%
+async def stream(agent, messages: list[AnyMessage]):
+    async for chunk in agent.astream(messages, stream_mode="updates"):
+        print(chunk)
+        print("\n")
+
+
+agent = build_agent_func_async(model, [web_search_async])
+run_async(stream(agent, [HumanMessage(content=search_query)]))
+
+
+# %% [markdown]
+# # Exercise 4.7 (Bonus): Turn the agent into a chatbot.
 #
 # Hint: We need a checkpointer: https://docs.langchain.com/oss/python/langgraph/persistence#checkpoints
 #
@@ -16,11 +16,12 @@
 
 # %%
 
-from ddgs import DDGS
 from langchain.messages import HumanMessage, SystemMessage
 
 # Initialize Model
+from llm import get_role_model
 from llm import model as llm
+from search_service import format_results, search_service
 from smolagents import LocalPythonExecutor
 
 # %% [markdown]
@@ -37,24 +38,40 @@ def search(query: str) -> str:
     """
     print(f"--> [Tool: Search] '{query}'")
     try:
-        results = DDGS().text(query, max_results=3)
-        return str(results)
+        return format_results(search_service().search(query, max_results=3))
     except Exception as e:
         return f"Search Error: {e}"
 
 
+def search_many(queries: list[str]) -> list[str]:
+    """
+    Searches the web for several queries at once (concurrently).
+    Returns the search results of each query as a string.
+    """
+    print(f"--> [Tool: Search] {queries}")
+    try:
+        batches = search_service().search_many(queries, max_results=3)
+        return [format_results(results) for results in batches]
+    except Exception as e:
+        return [f"Search Error: {e}"] * len(queries)
+
+
 # Exercise 7.1: Define the `synthesize` tool
 # This tool should take a string (content) and use the LLM to summarize/synthesize it.
 # We want the agent to use this to process search results.
-# Hint: Use `llm.invoke` with a prompt.
+# Hint: Use `llm.invoke` with a prompt. Summarizing is a short call, so it can use the
+# (smaller, faster) model of the "synthesizer" role (see `ROLES` in `llm_factory.py`).
 # <solution>
+synthesizer = get_role_model("synthesizer")
+
+
 def synthesize(content: str) -> str:
     """
     Synthesizes/Summarizes the provided content using an LLM.
     """
     print(f"--> [Tool: Synthesize] Processing {len(content)} chars...")
     prompt = f"Summarize and synthesize the following information:\n\n{content}"
-    response = llm.invoke(prompt)
+    response = synthesizer.invoke(prompt)
     return response.content
 
 
@@ -74,6 +91,7 @@ def synthesize(content: str) -> str:
 interpreter = LocalPythonExecutor(additional_authorized_imports=["datetime", "math"])
 # Inject our custom functions into the global scope of the interpreter
 interpreter.state["search"] = search
+interpreter.state["search_many"] = search_many
 interpreter.state["synthesize"] = synthesize
 # </solution>
 
@@ -93,6 +111,7 @@ Your goal is to answer the user's question by WRITING A PYTHON SCRIPT.
 
 You have access to the following built-in functions:
 - `search(query: str) -> str`: Search the web.
+- `search_many(queries: list[str]) -> list[str]`: Search the web for several independent queries at once (faster than calling `search` in a loop).
 - `synthesize(content: str) -> str`: Summarize information.
 - `print(obj)`: Print to stdout (visible to you).
 
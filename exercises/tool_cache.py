@@ -0,0 +1,239 @@
+"""
+Memoization for pure and idempotent tools.
+
+Agents call the same tool with the same arguments again and again, within a run (the
+model re-checks a sum) and across runs (evaluations, retries). `cacheable` marks a tool
+as safe to memoize; it goes on top of `@tool`:
+
+    @cacheable(ttl=3600, persist=True)
+    @tool
+    def web_search(query: str, max_results: int = 5):
+        ...
+
+Results are keyed by the tool name and its canonical arguments: defaults filled in,
+keys sorted, strings with collapsed whitespace, so `web_search("altana")` and
+`web_search(query=" altana ", max_results=5)` share an entry. Entries expire after `ttl`
+seconds (per tool, None: never). By default they live in an in-process LRU cache;
+with `persist=True` they are stored in SQLite (`TOOL_CACHE`, default
+`.cache/tool_cache.sqlite`) and reused by later runs. Only JSON-serializable results are
+persisted.
+
+A cache hit dispatches a `tool_cache_hit` custom event on the tool's run (visible in the
+trace and in `astream_events`), and `ToolCache.stats()` reports hits, misses and the
+tool time saved per tool.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from collections.abc import Callable
+from typing import Any
+
+from langchain_core.callbacks import adispatch_custom_event, dispatch_custom_event
+from langchain_core.tools import BaseTool
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_results (
+    key TEXT PRIMARY KEY,
+    tool TEXT NOT NULL,
+    value TEXT NOT NULL,
+    elapsed REAL NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+# arguments LangChain injects, which don't change the result
+_INJECTED = {"callbacks", "run_manager", "config"}
+
+
+def canonical_args(func: Callable, args: tuple, kwargs: dict[str, Any]) -> str:
+    """The arguments of a call to `func` as a canonical JSON string."""
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        kwargs = dict(bound.arguments)
+    except TypeError:
+        kwargs = {**kwargs, "*": list(args)}
+    return json.dumps(
+        {k: _canonical(v) for k, v in kwargs.items() if k not in _INJECTED},
+        sort_keys=True,
+        default=repr,
+    )
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if hasattr(value, "model_dump"):
+        return _canonical(value.model_dump())
+    return value
+
+
+class _ToolStats:
+    def __init__(self):
+        self.hits = self.misses = 0
+        self.saved = 0.0
+
+
+class ToolCache:
+    """Tool results in an LRU dict (`path=None`) or in SQLite."""
+
+    def __init__(self, path: str | None = None, maxsize: int = 4096):
+        self.path = path
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[Any, float, float]] = OrderedDict()
+        self._stats: dict[str, _ToolStats] = defaultdict(_ToolStats)
+        self.db = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.executescript(SCHEMA)
+
+    @staticmethod
+    def key(tool: str, args: str) -> str:
+        return hashlib.sha256(f"{tool}\0{args}".encode()).hexdigest()
+
+    def lookup(self, tool: str, key: str, ttl: float | None) -> tuple[bool, Any, float]:
+        """(found, value, seconds the original call took)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self.db is not None:
+                row = self.db.execute(
+                    "SELECT value, elapsed, created FROM tool_results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1], row[2])
+            if entry is not None and ttl is not None and time.time() - entry[2] > ttl:
+                entry = None
+            stats = self._stats[tool]
+            if entry is None:
+                stats.misses += 1
+                return False, None, 0.0
+            self._remember(key, entry)
+            stats.hits += 1
+            stats.saved += entry[1]
+            return True, entry[0], entry[1]
+
+    def update(self, tool: str, key: str, value: Any, elapsed: float):
+        entry = (value, elapsed, time.time())
+        with self._lock:
+            self._remember(key, entry)
+            if self.db is None:
+                return
+            try:
+                data = json.dumps(value)
+            except (TypeError, ValueError):
+                return  # kept in memory only
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO tool_results VALUES (?, ?, ?, ?, ?)",
+                    (key, tool, data, elapsed, entry[2]),
+                )
+
+    def _remember(self, key: str, entry: tuple[Any, float, float]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.db is not None:
+                with self.db:
+                    self.db.execute("DELETE FROM tool_results")
+
+    def stats(self) -> dict[str, dict]:
+        """Hits, misses and tool time saved (seconds) per tool."""
+        with self._lock:
+            return {
+                tool: {"hits": s.hits, "misses": s.misses, "saved_s": s.saved}
+                for tool, s in self._stats.items()
+            }
+
+
+_caches: dict[bool, ToolCache] = {}
+_caches_lock = threading.Lock()
+
+
+def tool_cache(persist: bool = False) -> ToolCache:
+    """The in-process or the persistent cache shared by all tools."""
+    with _caches_lock:
+        if persist not in _caches:
+            path = os.environ.get("TOOL_CACHE", ".cache/tool_cache.sqlite") if persist else None
+            _caches[persist] = ToolCache(path)
+        return _caches[persist]
+
+
+def cacheable(
+    ttl: float | None = None, persist: bool = False, cache: ToolCache | None = None
+) -> Callable[[BaseTool], BaseTool]:
+    """Memoize a tool created with `@tool` (see the module docstring)."""
+
+    def decorate(tool: BaseTool) -> BaseTool:
+        store = cache or tool_cache(persist)
+        func, coroutine = getattr(tool, "func", None), getattr(tool, "coroutine", None)
+        if func is None and coroutine is None:
+            raise TypeError(f"Tool '{tool.name}' has no function to memoize.")
+        metadata = {**(tool.metadata or {}), "cache": {"ttl": ttl, "persist": persist}}
+        update: dict[str, Any] = {"metadata": metadata}
+
+        def event(elapsed: float) -> dict:
+            return {"tool": tool.name, "saved_s": elapsed}
+
+        if func is not None:
+
+            @functools.wraps(func)
+            def cached_func(*args, **kwargs):
+                key = store.key(tool.name, canonical_args(func, args, kwargs))
+                found, value, elapsed = store.lookup(tool.name, key, ttl)
+                if found:
+                    try:
+                        dispatch_custom_event("tool_cache_hit", event(elapsed))
+                    except RuntimeError:
+                        pass  # called outside of a run
+                    return value
+                started = time.perf_counter()
+                value = func(*args, **kwargs)
+                store.update(tool.name, key, value, time.perf_counter() - started)
+                return value
+
+            update["func"] = cached_func
+
+        if coroutine is not None:
+
+            @functools.wraps(coroutine)
+            async def cached_coroutine(*args, **kwargs):
+                key = store.key(tool.name, canonical_args(coroutine, args, kwargs))
+                found, value, elapsed = store.lookup(tool.name, key, ttl)
+                if found:
+                    try:
+                        await adispatch_custom_event("tool_cache_hit", event(elapsed))
+                    except RuntimeError:
+                        pass  # called outside of a run
+                    return value
+                started = time.perf_counter()
+                value = await coroutine(*args, **kwargs)
+                store.update(tool.name, key, value, time.perf_counter() - started)
+                return value
+
+            update["coroutine"] = cached_coroutine
+
+        return tool.model_copy(update=update)
+
+    return decorate
@@ -0,0 +1,126 @@
+"""
+Concurrent execution of the tool calls of one agent step.
+
+When the model asks for several independent tool calls at once (five `web_search`
+queries, say), running them one after another adds up their latencies.
+`run_tool_calls` runs them on a thread pool, `arun_tool_calls` with `asyncio.gather`;
+both run at most `max_concurrency` calls at a time and return the `ToolMessage`s in the
+order of the tool calls, whatever order they finish in.
+
+A call that runs longer than its timeout (`timeouts[name]`, else `timeout`) is answered
+with an error `ToolMessage`, so the model can retry or do without. A sync tool's thread
+can't be interrupted; it finishes in the background and its result is dropped. Other
+exceptions propagate, as with a plain loop.
+
+    messages = run_tool_calls(ai_message.tool_calls, tools_by_name, timeouts={"web_search": 20})
+"""
+
+import asyncio
+import contextvars
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any
+
+from langchain_core.messages import ToolCall, ToolMessage
+from langchain_core.tools import BaseTool
+
+
+def call_tool(tool: BaseTool, tool_call: ToolCall) -> ToolMessage:
+    """Run `tool` on `tool_call` (also async-only tools, in an event loop of their own)."""
+    if getattr(tool, "func", True) is None and getattr(tool, "coroutine", None):
+        observation = asyncio.run(tool.ainvoke(tool_call["args"]))
+    else:
+        observation = tool.invoke(tool_call["args"])
+    return _tool_message(observation, tool_call)
+
+
+async def acall_tool(tool: BaseTool, tool_call: ToolCall) -> ToolMessage:
+    # sync tools run in the default executor
+    return _tool_message(await tool.ainvoke(tool_call["args"]), tool_call)
+
+
+def _tool_message(observation: Any, tool_call: ToolCall) -> ToolMessage:
+    if isinstance(observation, ToolMessage):
+        return observation
+    return ToolMessage(content=observation, name=tool_call["name"], tool_call_id=tool_call["id"])
+
+
+def _timed_out(tool_call: ToolCall, timeout: float) -> ToolMessage:
+    return ToolMessage(
+        content=f"Error: tool '{tool_call['name']}' timed out after {timeout:g}s.",
+        name=tool_call["name"],
+        tool_call_id=tool_call["id"],
+        status="error",
+    )
+
+
+def run_tool_calls(
+    tool_calls: list[ToolCall],
+    tools_by_name: dict[str, BaseTool],
+    max_concurrency: int = 8,
+    timeout: float | None = 60.0,
+    timeouts: dict[str, float] | None = None,
+    call: Callable[[BaseTool, ToolCall], ToolMessage] = call_tool,
+) -> list[ToolMessage]:
+    """Run `tool_calls` concurrently on threads; the results are in the calls' order."""
+    timeouts = timeouts or {}
+    limits = [timeouts.get(tool_call["name"], timeout) for tool_call in tool_calls]
+    if len(tool_calls) == 1 and limits[0] is None:
+        return [call(tools_by_name[tool_calls[0]["name"]], tool_calls[0])]
+
+    results: list[ToolMessage | None] = [None] * len(tool_calls)
+    queued = iter(range(len(tool_calls)))
+    running: dict[Future, tuple[int, float | None]] = {}  # future -> (index, deadline)
+    # a thread per call: a timed out call keeps its thread, but frees its slot
+    executor = ThreadPoolExecutor(max_workers=len(tool_calls), thread_name_prefix="tool")
+    try:
+        while True:
+            while len(running) < max_concurrency and (i := next(queued, None)) is not None:
+                tool = tools_by_name[tool_calls[i]["name"]]
+                # each call runs in a copy of the caller's context (run config, tracing)
+                context = contextvars.copy_context()
+                future = executor.submit(context.run, call, tool, tool_calls[i])
+                deadline = time.monotonic() + limits[i] if limits[i] is not None else None
+                running[future] = (i, deadline)
+            if not running:
+                break
+            deadlines = [deadline for _, deadline in running.values() if deadline is not None]
+            wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            done, _ = wait(running, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, _ = running.pop(future)
+                results[i] = future.result()
+            now = time.monotonic()
+            for future, (i, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline:
+                    results[i] = _timed_out(tool_calls[i], limits[i])
+                    future.cancel()
+                    del running[future]
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+async def arun_tool_calls(
+    tool_calls: list[ToolCall],
+    tools_by_name: dict[str, BaseTool],
+    max_concurrency: int = 8,
+    timeout: float | None = 60.0,
+    timeouts: dict[str, float] | None = None,
+) -> list[ToolMessage]:
+    """Run `tool_calls` concurrently on the event loop; the results are in the calls' order."""
+    timeouts = timeouts or {}
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(tool_call: ToolCall) -> ToolMessage:
+        limit = timeouts.get(tool_call["name"], timeout)
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    acall_tool(tools_by_name[tool_call["name"]], tool_call), limit
+                )
+            except asyncio.TimeoutError:
+                return _timed_out(tool_call, limit)
+
+    return list(await asyncio.gather(*(run(tool_call) for tool_call in tool_calls)))
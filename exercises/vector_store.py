@@ -0,0 +1,502 @@
+"""
+A persistent, incrementally updated vector store for the RAG exercise.
+
+The index lives in a directory with two files:
+
+* `embeddings.f32`: a raw float32 matrix (one L2-normalized row per chunk) that is
+  opened memory-mapped, so searching it does not load the corpus into Python objects.
+* `chunks.sqlite`: the chunk text and metadata (keyed by matrix row) and the
+  SHA-256 content hash of every indexed file.
+
+Search goes through a pluggable nearest-neighbour backend from `ann.py` (exact search
+for small corpora, IVF for large ones); the IVF clustering is saved next to the matrix.
+With `storage="float16"` or `"int8"` the backend searches a compact in-memory copy of
+the matrix (`quantization.py`) and the best `rescore` candidates are re-scored exactly
+against the float32 matrix on disk.
+
+A BM25 index over the chunk text (`bm25.npz`) is rebuilt whenever `sync()` changed the
+index, for hybrid retrieval.
+
+`sync()` compares the content hashes with the files on disk: only added or changed
+files are ingested and embedded again, and rows of deleted files are dropped. The
+embedding model and the chunking settings are recorded too; when either changes, the
+index is rebuilt.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from collections.abc import Callable, Iterable
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from ann import make_index, resolve_backend
+from bm25 import BM25Index
+from embedding_cache import embed_queries, embedding_id
+from quantization import STORAGE_TYPES, QuantizedMatrix
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, sha256 TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    row INTEGER NOT NULL,
+    source TEXT,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_row ON chunks (row);
+CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source);
+"""
+
+
+def file_sha256(path: str) -> str:
+    """Content hash of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize(vectors) -> np.ndarray:
+    """L2-normalize rows so that a dot product is the cosine similarity."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class PersistentVectorStore(VectorStore):
+    """Vector store backed by a memory-mapped embedding matrix and a SQLite chunk table."""
+
+    def __init__(
+        self,
+        index_dir: str,
+        embedding: Embeddings,
+        backend: str = "auto",
+        exact_threshold: int = 20_000,
+        storage: str = "float32",
+        rescore: int | None = 32,
+        **index_params,
+    ):
+        """
+        `backend` is one of `ann.BACKENDS` or "auto"; `index_params` (e.g. `n_probe`)
+        are passed on to the backend. `storage` is one of `quantization.STORAGE_TYPES`;
+        for compact storage, `rescore` candidates are re-scored exactly (None disables it).
+        """
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown storage '{storage}'. Choose one of {STORAGE_TYPES}.")
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = index_dir
+        self.embedding = embedding
+        self.storage = storage
+        self.rescore = rescore
+        self.backend = backend
+        self.exact_threshold = exact_threshold
+        self.index_params = index_params
+        self.matrix_path = os.path.join(index_dir, "embeddings.f32")
+        self.ann_path = os.path.join(index_dir, "ann.npz")
+        self.bm25_path = os.path.join(index_dir, "bm25.npz")
+        self.quantized_path = os.path.join(index_dir, f"embeddings.{storage}.npz")
+        self.db = sqlite3.connect(
+            os.path.join(index_dir, "chunks.sqlite"), check_same_thread=False
+        )
+        self.db.executescript(SCHEMA)
+        self._matrix = None
+        self._search_matrix = None
+        self._index = None
+        self._lexical = None
+        self._check_consistency()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    # -- index bookkeeping ------------------------------------------------------
+
+    @property
+    def dim(self) -> int | None:
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def _meta(self, key: str) -> str | None:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def generation(self) -> int:
+        """Incremented on every write, so derived data (the ANN index) can be invalidated."""
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _bump_generation(self):
+        self.db.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)",
+            (self.generation + 1,),
+        )
+        self._matrix = None
+        self._search_matrix = None
+        self._index = None
+        self._lexical = None
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The (read-only, memory-mapped) embedding matrix."""
+        if self._matrix is None:
+            n, dim = len(self), self.dim
+            if not n:
+                return np.empty((0, dim or 0), dtype=np.float32)
+            self._matrix = np.memmap(
+                self.matrix_path, dtype=np.float32, mode="r", shape=(n, dim)
+            )
+        return self._matrix
+
+    @property
+    def search_matrix(self):
+        """The matrix the search backend scans: `matrix` itself, or a compact copy of it."""
+        if self.storage == "float32":
+            return self.matrix
+        if self._search_matrix is None:
+            if os.path.exists(self.quantized_path):
+                saved = dict(np.load(self.quantized_path))
+                if saved.pop("generation") == self.generation:
+                    self._search_matrix = QuantizedMatrix(**saved)
+            if self._search_matrix is None:
+                self._search_matrix = QuantizedMatrix.quantize(self.matrix, self.storage)
+                np.savez(
+                    self.quantized_path,
+                    generation=self.generation,
+                    **self._search_matrix.state(),
+                )
+        return self._search_matrix
+
+    @property
+    def index(self):
+        """The nearest-neighbour index over `matrix`, loaded from disk when up to date."""
+        if self._index is None:
+            backend = resolve_backend(len(self), self.backend, self.exact_threshold)
+            params = dict(self.index_params)
+            if os.path.exists(self.ann_path):
+                saved = dict(np.load(self.ann_path))
+                if saved.pop("generation") == self.generation and saved.pop("backend") == backend:
+                    params["state"] = saved
+            self._index = make_index(self.search_matrix, backend, **params)
+            if hasattr(self._index, "state") and "state" not in params:
+                np.savez(
+                    self.ann_path,
+                    generation=self.generation,
+                    backend=backend,
+                    **self._index.state(),
+                )
+        return self._index
+
+    @property
+    def lexical(self) -> BM25Index:
+        """The BM25 index over the chunk text, loaded from disk when up to date."""
+        if self._lexical is None:
+            if os.path.exists(self.bm25_path):
+                saved = dict(np.load(self.bm25_path))
+                if saved.pop("generation") == self.generation:
+                    self._lexical = BM25Index.from_state(saved)
+            if self._lexical is None:
+                # stream the chunks from SQLite instead of loading them all at once
+                self._lexical = BM25Index.build(self.db.execute("SELECT id, text FROM chunks"))
+                np.savez(self.bm25_path, generation=self.generation, **self._lexical.state())
+        return self._lexical
+
+    def _check_consistency(self):
+        """Reset the index if a previous write was interrupted half-way."""
+        n, dim = len(self), self.dim
+        size = os.path.getsize(self.matrix_path) if os.path.exists(self.matrix_path) else 0
+        expected = n * (dim or 0) * 4
+        if size != expected:
+            print(f"Warning: index in {self.index_dir} is inconsistent, rebuilding it.")
+            with self.db:
+                self.db.execute("DELETE FROM chunks")
+                self.db.execute("DELETE FROM files")
+            if os.path.exists(self.matrix_path):
+                os.remove(self.matrix_path)
+
+    def indexed_files(self) -> dict[str, str]:
+        """Map of indexed file path to its content hash."""
+        return dict(self.db.execute("SELECT path, sha256 FROM files"))
+
+    # -- writing ----------------------------------------------------------------
+
+    def sync(
+        self,
+        files: Iterable[str],
+        ingest: Callable[[list[str]], Iterable[tuple[list[Document], list[str]]]],
+        chunking: dict | None = None,
+    ) -> dict[str, int]:
+        """
+        Bring the index up to date with `files`.
+
+        Unchanged files are skipped and files that are gone are removed. Added or
+        changed files are passed to `ingest` (e.g. `PdfIngestor.batches`), which
+        yields `(chunks, finished_files)` batches; every batch is embedded with one
+        call, and a file's hash is recorded once all of its chunks are stored.
+
+        `chunking` describes how `ingest` chunks the files (default: the ingestor's
+        `settings()`). If it or the embedding model differs from the ones the index
+        was built with, all files are ingested again.
+        """
+        if chunking is None and hasattr(getattr(ingest, "__self__", None), "settings"):
+            chunking = ingest.__self__.settings()
+        settings = {
+            "embedding": embedding_id(self.embedding),
+            "chunking": json.dumps(chunking, sort_keys=True) if chunking is not None else None,
+        }
+        changed = [
+            key
+            for key, value in settings.items()
+            if value is not None and len(self) and self._meta(key) != value
+        ]
+        if changed:
+            print(f"Index settings changed ({', '.join(changed)}), rebuilding the index.")
+            self.delete()
+            with self.db:
+                self.db.execute("DELETE FROM meta WHERE key = 'dim'")  # may change, too
+        for key, value in settings.items():
+            if value is not None:
+                self._set_meta(key, value)
+
+        hashes = {path: file_sha256(path) for path in files}
+        indexed = self.indexed_files()
+
+        stale = [p for p, h in indexed.items() if hashes.get(p) != h]
+        todo = [p for p, h in hashes.items() if indexed.get(p) != h]
+        stats = {
+            "added": sum(p not in indexed for p in todo),
+            "changed": sum(p in indexed for p in todo),
+            "removed": sum(p not in hashes for p in stale),
+            "unchanged": len(hashes) - len(todo),
+        }
+
+        self.delete_sources(stale)
+        if todo:
+            for documents, finished in ingest(todo):
+                self.add_documents(documents)
+                with self.db:
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO files (path, sha256) VALUES (?, ?)",
+                        [(path, hashes[path]) for path in finished],
+                    )
+        if stale or todo:
+            self.lexical  # build the lexical index at ingest time, not on the first query
+
+        print(
+            f"Index synced: {stats['added']} added, {stats['changed']} changed, "
+            f"{stats['removed']} removed, {stats['unchanged']} unchanged ({len(self)} chunks)."
+        )
+        return stats
+
+    def add_documents(self, documents: list[Document], **kwargs: Any) -> list[str]:
+        if not documents:
+            return []
+        vectors = self.embedding.embed_documents([d.page_content for d in documents])
+        return self.add_embeddings(documents, vectors)
+
+    def add_embeddings(self, documents: list[Document], vectors) -> list[str]:
+        """Append already embedded documents to the index."""
+        vectors = normalize(vectors)
+        with self.db:
+            if self.dim is None:
+                self.db.execute(
+                    "INSERT INTO meta (key, value) VALUES ('dim', ?)", (vectors.shape[1],)
+                )
+                self.db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('embedding', ?)",
+                    (embedding_id(self.embedding),),
+                )
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match the index ({self.dim})."
+                )
+            start = len(self)
+            self.db.executemany(
+                "INSERT INTO chunks (row, source, text, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (start + i, d.metadata.get("source"), d.page_content, json.dumps(d.metadata))
+                    for i, d in enumerate(documents)
+                ],
+            )
+            with open(self.matrix_path, "ab") as f:
+                f.write(vectors.tobytes())
+            ids = self.db.execute(
+                "SELECT id FROM chunks WHERE row >= ? ORDER BY row", (start,)
+            ).fetchall()
+            self._bump_generation()
+        return [str(id_) for (id_,) in ids]
+
+    def delete_sources(self, sources: list[str]):
+        """Drop all chunks (and the file hashes) of the given source files."""
+        if not sources:
+            return
+        marks = ",".join("?" * len(sources))
+        with self.db:
+            self.db.execute(f"DELETE FROM files WHERE path IN ({marks})", sources)
+        self._drop_rows(f"source IN ({marks})", sources)
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        if ids is None:
+            self.delete_sources(list(self.indexed_files()))
+            self._drop_rows("1", [])
+            return True
+        marks = ",".join("?" * len(ids))
+        self._drop_rows(f"id IN ({marks})", [int(i) for i in ids])
+        return True
+
+    def _drop_rows(self, where: str, params: list):
+        """Delete matching chunks and compact the matrix so that rows stay contiguous."""
+        kept = [
+            row
+            for (row,) in self.db.execute(
+                f"SELECT row FROM chunks WHERE NOT ({where}) ORDER BY row", params
+            )
+        ]
+        if len(kept) == len(self):
+            return
+
+        # Copy the surviving rows block-wise into a new file.
+        tmp_path = self.matrix_path + ".tmp"
+        old = self.matrix
+        with open(tmp_path, "wb") as f:
+            for i in range(0, len(kept), 4096):
+                f.write(np.ascontiguousarray(old[kept[i : i + 4096]]).tobytes())
+        old = None
+
+        # Rows only move down, so renumbering in ascending order never collides.
+        with self.db:
+            self.db.execute(f"DELETE FROM chunks WHERE {where}", params)
+            self.db.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?",
+                [(new, row) for new, row in enumerate(kept) if new != row],
+            )
+            self._bump_generation()
+        os.replace(tmp_path, self.matrix_path)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict] | None = None,
+        *,
+        index_dir: str = "data/index",
+        **kwargs: Any,
+    ) -> "PersistentVectorStore":
+        store = cls(index_dir, embedding)
+        store.add_texts(texts, metadatas)
+        return store
+
+    # -- searching --------------------------------------------------------------
+
+    def _fetch_rows(self, rows: list[int]) -> dict[int, Document]:
+        if not rows:
+            return {}
+        rows = [int(r) for r in rows]
+        marks = ",".join("?" * len(rows))
+        return {
+            row: Document(id=str(id_), page_content=text, metadata=json.loads(metadata))
+            for id_, row, text, metadata in self.db.execute(
+                f"SELECT id, row, text, metadata FROM chunks WHERE row IN ({marks})", rows
+            )
+        }
+
+    def get_by_rows(self, rows: list[int]) -> list[Document]:
+        """Load the chunks for the given matrix rows, in the given order."""
+        found = self._fetch_rows(rows)
+        return [found[int(r)] for r in rows if int(r) in found]
+
+    def get_by_ids(self, ids, /) -> list[Document]:
+        ids = [int(i) for i in ids]
+        marks = ",".join("?" * len(ids))
+        rows = dict(self.db.execute(f"SELECT id, row FROM chunks WHERE id IN ({marks})", ids))
+        return self.get_by_rows([rows[i] for i in ids if i in rows])
+
+    def search_vectors(self, vectors, k: int = 4) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        """Top-k rows and cosine scores for each query vector."""
+        if not len(self):
+            empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+            return [empty[0]] * len(vectors), [empty[1]] * len(vectors)
+        queries = normalize(vectors)
+        rescore = self.storage != "float32" and self.rescore
+        rows, scores = self.index.search(queries, max(k, self.rescore) if rescore else k)
+        all_rows, all_scores = [], []
+        for query, query_rows, query_scores in zip(queries, rows, scores):
+            found = query_rows >= 0
+            query_rows, query_scores = query_rows[found], query_scores[found]
+            if rescore:
+                # exact scores from the float32 matrix; only the candidate rows are read
+                order = np.argsort(query_rows)
+                query_rows = query_rows[order]
+                query_scores = np.asarray(self.matrix[query_rows]) @ query
+                best = np.argsort(-query_scores)[:k]
+                query_rows, query_scores = query_rows[best], query_scores[best]
+            all_rows.append(query_rows)
+            all_scores.append(query_scores)
+        return all_rows, all_scores
+
+    def search_vector(self, embedding: list[float], k: int = 4) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k rows and cosine scores for a query vector."""
+        rows, scores = self.search_vectors([embedding], k)
+        return rows[0], scores[0]
+
+    def similarity_search_many(self, queries: list[str], k: int = 4) -> list[list[Document]]:
+        """
+        Top-k documents for each of several queries, scored together (one matrix product
+        for exact search). The queries are embedded as by `embed_query`, like in
+        `similarity_search` (asymmetric models embed queries and documents differently),
+        but together, with `embed_queries`.
+        """
+        if not queries or not len(self):
+            return [[] for _ in queries]
+        vectors = embed_queries(self.embedding, list(queries))
+        rows, _ = self.search_vectors(vectors, k)
+        docs = self._fetch_rows(np.unique(np.concatenate(rows)).tolist())
+        return [[docs[r] for r in query_rows.tolist() if r in docs] for query_rows in rows]
+
+    def lexical_search(self, query: str, k: int = 4) -> list[Document]:
+        """BM25 keyword search, e.g. for exact product codes."""
+        if not len(self):
+            return []
+        ids, _ = self.lexical.search(query, k)
+        return self.get_by_ids(ids.tolist())
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4
+    ) -> list[tuple[Document, float]]:
+        rows, scores = self.search_vector(embedding, k)
+        return list(zip(self.get_by_rows(rows.tolist()), scores.tolist()))
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k
+        )
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return self._cosine_relevance_score_fn
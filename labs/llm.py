@@ -1,17 +1,14 @@
-import os
+# The model factory is shared with the exercises: the labs put `../exercises` on the path.
+from llm_factory import BACKEND, get_model, get_role_model, metrics  # noqa: F401
 
-model = None
-
-if "DATABRICKS_RUNTIME_VERSION" in os.environ:
-    print("Running on Databricks.")
-    from databricks_langchain import ChatDatabricks
-
-    model = ChatDatabricks(endpoint="databricks-claude-sonnet-4-5", temperature=0)
+if BACKEND == "fake":
+    print("Running offline with the fake models.")
 else:
-    print("Running locally.")
+    print("Running on Databricks." if BACKEND == "databricks" else "Running locally.")
 
-    import dotenv
-    from langchain_openai.chat_models.azure import AzureChatOpenAI
 
-    dotenv.load_dotenv()
-    model = AzureChatOpenAI(deployment_name="gpt-4.1", temperature=0)
+def __getattr__(name: str):
+    # `model` is created on first access, without importing the provider package.
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
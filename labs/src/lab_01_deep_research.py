@@ -24,6 +24,8 @@
 
 # %%
 import operator
+import os
+import sys
 from typing import Annotated, List, TypedDict
 
 try:
@@ -31,16 +33,25 @@ try:
 except ImportError:
     from typing_extensions import NotRequired
 
-from langchain_community.tools import DuckDuckGoSearchRun
 from langgraph.graph import END, START, StateGraph
 from langgraph.types import Command, Send, interrupt
-
-# Initialize Model
-from llm import model as llm
 from pydantic import BaseModel, Field
 
-# Initialize Search Tool
-search_tool = DuckDuckGoSearchRun()
+# The model factory and the search service are shared with the exercises (run from `labs/`)
+sys.path.append(os.path.abspath(os.path.join("..", "exercises")))
+
+# Initialize Models: one per role, so that short calls (like the judge's) can go to a
+# smaller, faster endpoint (see `ROLES` in `exercises/llm_factory.py`)
+from llm import get_role_model, metrics  # noqa: E402
+from llm import model as llm  # noqa: E402
+
+# Initialize Search: the shared search service (cached, rate-limited, offline fixtures with
+# `LLM_BACKEND=fake`, see `exercises/search_service.py`)
+from search_service import format_results, search_service  # noqa: E402
+
+planner_llm = get_role_model("planner")
+writer_llm = get_role_model("writer")
+judge_llm = get_role_model("judge")
 
 # %% [markdown]
 # ## Exercise 1: State Definition
@@ -105,7 +116,7 @@ def chief_editor_node(state: ResearchState):
     # Use the LLM to generate a 'ResearchPlan' from the topic.
     # Hint: have a look at https://docs.langchain.com/oss/python/langchain/structured-output
     # <solution>
-    planner = llm.with_structured_output(ResearchPlan)
+    planner = planner_llm.with_structured_output(ResearchPlan)
     prompt = (
         f"You are a Research Manager. Your goal is to break down the following research topic into 3 distinct, "
         f"targeted sub-topics that will convince a search engine to reveal specific facts, numbers, or data points.\n\n"
@@ -126,7 +137,7 @@ def research_worker_node(state: SubTaskState):
     # Use 'search_tool' to find info and return it in 'research_outputs'.
     # <solution>
     try:
-        res = search_tool.invoke(topic)
+        res = format_results(search_service().search(topic))
     except Exception as e:
         res = f"Search failed: {e}"
 
@@ -155,7 +166,7 @@ def writer_node(state: ResearchState):
     2. End with a "Final Answer:" section.
     """
 
-    response = llm.invoke(prompt)
+    response = writer_llm.invoke(prompt)
     return {"final_report": response.content}
     # </solution>
 
@@ -234,7 +245,7 @@ def planner_node(state: ResearchStateHITL):
     # Exercise 4.1: Implement the Planner
     # Use the LLM to generate a 'ResearchPlan' from the topic.
     # <solution>
-    planner = llm.with_structured_output(ResearchPlan)
+    planner = planner_llm.with_structured_output(ResearchPlan)
 
     # If there is a critique, we are regenerating
     if state.get("critique"):
@@ -421,7 +432,6 @@ run_research_interactive()
 import re
 
 import pandas as pd
-from ddgs import DDGS
 from langchain.agents import create_agent
 from langchain.tools import tool
 
@@ -429,7 +439,7 @@ from langchain.tools import tool
 @tool
 def web_search(query: str, max_results: int = 5):
     """Run a web search"""
-    return str(DDGS().text(query, max_results=max_results))
+    return format_results(search_service().search(query, max_results=max_results))
 
 
 # 1. Setup ReAct Baseline
@@ -467,7 +477,7 @@ def query_judge_model(question, predicted, truth, metadata):
     REASON: [Short explanation]
     """
     try:
-        return llm.invoke(prompt).content
+        return judge_llm.invoke(prompt).content
     except Exception as e:
         return f"SCORE: 0 REASON: Error calling judge: {e}"
 
@@ -493,6 +503,8 @@ if not filtered_df.empty:
         predicted_dr = result_dr.get("final_report", "No report generated.")
         judge_resp_dr = query_judge_model(question, predicted_dr, truth, metadata)
         score_dr = extract_score(judge_resp_dr)
+        # reported per role and credited to the preset that wrote the report (`llm_metrics.py`)
+        metrics().record_score("writer", score_dr)
         print(f"Deep Research Score: {score_dr}")
 
         # Agent 2: ReAct Baseline
@@ -19,18 +19,27 @@
 # %restart_python
 
 # %%
+import os
 import re
+import sys
 
 import pandas as pd
-from ddgs import DDGS
 from langchain.agents import create_agent
 from langchain.messages import HumanMessage
 from langchain.tools import tool
-
-# Initialize generic model
-from llm import model as llm
 from smolagents import LocalPythonExecutor
 
+# The model factory, the scheduler and the search service are shared with the exercises
+# (run from `labs/`)
+sys.path.append(os.path.abspath(os.path.join("..", "exercises")))
+
+# Initialize generic model, and the models of the supervisor and judge roles (see
+# `ROLES` in `exercises/llm_factory.py`)
+from llm import get_role_model, metrics  # noqa: E402
+from llm import model as llm  # noqa: E402
+from scheduler import priority  # noqa: E402
+from search_service import format_results, search_service  # noqa: E402
+
 # %% [markdown]
 # ## 1. Define Sub-Agents (The Specialists)
 #
@@ -39,10 +48,12 @@ from smolagents import LocalPythonExecutor
 
 
 # %%
+# searches go through the shared search service, which caches the results on disk (see
+# `exercises/search_service.py`)
 @tool
 def web_search(query: str, max_results: int = 5):
     """Run a web search"""
-    return str(DDGS().text(query, max_results=max_results))
+    return format_results(search_service().search(query, max_results=max_results))
 
 
 def make_search_agent():
@@ -178,7 +189,9 @@ def make_main_agent():
     # Give it access to `search_tools` and `call_tool`.
     # <solution>
     return create_agent(
-        llm, tools=[search_tools, call_tool], system_prompt=system_prompt
+        get_role_model("supervisor"),
+        tools=[search_tools, call_tool],
+        system_prompt=system_prompt,
     )
     # </solution>
 
@@ -189,9 +202,18 @@ main_agent = make_main_agent()
 # ## 4. Evaluation Loop (GAIA Benchmark)
 #
 # We evaluate the system on the GAIA validation set.
+#
+# The model runs with `temperature=0`, so re-runs send the same prompts. Set the
+# `LLM_CACHE` environment variable (e.g. `LLM_CACHE=.cache/responses.sqlite`) before
+# starting the kernel to cache the model's responses on disk: unchanged calls are then
+# answered from the cache and a re-run takes seconds.
+#
+# The evaluation runs at `batch` priority: while it runs, interactive requests to the
+# same model are scheduled first (see `exercises/scheduler.py`).
 
 
 # %%
+@priority("batch")
 def run_gaia_eval():
     csv_path = "gaia_validation_level1.csv"  # Ensure this file exists in CWD
     try:
@@ -215,7 +237,7 @@ def run_gaia_eval():
         Format: SCORE: <int>
         """
         try:
-            res = llm.invoke(prompt).content
+            res = get_role_model("judge").invoke(prompt).content
             match = re.search(r"SCORE:\s*(\d+)", res)
             return int(match.group(1)) if match else 0
         except:
@@ -240,6 +262,7 @@ def run_gaia_eval():
         print(f"[Result]: {predicted[:100]}...")
 
         score = query_judge(question, predicted, truth)
+        metrics().record_score("supervisor", score)
         print(f"[Score]: {score}")
 
         results.append(